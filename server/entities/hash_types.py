@@ -13,18 +13,17 @@ class HashType(Enum):
 
     @staticmethod
     def hash_detection(resource):
-        md5_regex = r"^[A-Fa-f0-9]{32}$"
-        sha1_regex = r"^[A-Fa-f0-9]{40}$"
-        sha256_regex = r"^[A-Fa-f0-9]{64}$"
-        sha512_regex = r"^[A-Fa-f0-9]{128}$"
-
-        if re.fullmatch(md5_regex, resource):
-            return HashType.MD5
-        elif re.fullmatch(sha1_regex, resource):
-            return HashType.SHA1
-        elif re.fullmatch(sha256_regex, resource):
-            return HashType.SHA256
-        elif re.fullmatch(sha512_regex, resource):
-            return HashType.SHA512
-
-        return HashType.UNKNOWN
+        if not HEX_REGEX.fullmatch(resource):
+            return HashType.UNKNOWN
+
+        return HASH_LENGTHS.get(len(resource), HashType.UNKNOWN)
+
+
+HEX_REGEX = re.compile(r"[A-Fa-f0-9]+")
+
+HASH_LENGTHS = {
+    32: HashType.MD5,
+    40: HashType.SHA1,
+    64: HashType.SHA256,
+    128: HashType.SHA512,
+}
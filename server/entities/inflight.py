@@ -0,0 +1,173 @@
+import traceback
+
+from server.redis_db import RedisRegistry
+
+# Lease of an in-flight plugin task, in seconds, when its queue has none
+DEFAULT_LEASE = 300
+
+# Returned by a plugin task passing its run, and its lease, to a follow-up task
+HANDED_OFF = "inflight:handed_off"
+
+# How long a revoked task id is remembered, in seconds
+REVOKED_RETENTION = 3600
+
+# Takes the lease for ARGV[1], or registers project ARGV[2] as waiting for the
+# task holding it, atomically. Returns {1, ARGV[1]} or {0, running task id}
+ACQUIRE_SCRIPT = """
+if redis.call("SET", KEYS[1], ARGV[1], "NX", "EX", ARGV[3]) then
+    return {1, ARGV[1]}
+end
+local running = redis.call("GET", KEYS[1])
+redis.call("SADD", KEYS[2], ARGV[2])
+redis.call("EXPIRE", KEYS[2], ARGV[3])
+return {0, running}
+"""
+
+# Drops the lease and its waiting projects only if the lease is still held by
+# ARGV[1], returns the waiting project ids
+RELEASE_SCRIPT = """
+if redis.call("GET", KEYS[1]) ~= ARGV[1] then
+    return {}
+end
+local waiting = redis.call("SMEMBERS", KEYS[2])
+redis.call("DEL", KEYS[1], KEYS[2])
+return waiting
+"""
+
+
+def _key(plugin_name, resource_id):
+    return f"inflight:{plugin_name}:{resource_id}"
+
+
+def _waiting_key(plugin_name, resource_id):
+    return f"inflight:{plugin_name}:{resource_id}:projects"
+
+
+def _revoked_key(task_id):
+    return f"revoked:{task_id}"
+
+
+class InFlight:
+    """
+        Single-flight registry of running plugin tasks, keyed by (plugin, resource).
+        The first launch takes a lease holding its task id. Later launches of the
+        same pair coalesce onto that task and only register their project, which
+        is notified when the results are stored. Leases expire, so a lost worker
+        does not block a plugin forever.
+    """
+
+    @staticmethod
+    def acquire(plugin_name, resource_id, task_id, project_id, lease=DEFAULT_LEASE):
+        """
+            Returns (True, task_id) if the caller has to send its task,
+            (False, running task id) if the launch was coalesced.
+            If Redis is not reachable every launch goes through.
+        """
+        try:
+            acquired, running_task_id = RedisRegistry.get_client().eval(
+                ACQUIRE_SCRIPT,
+                2,
+                _key(plugin_name, resource_id),
+                _waiting_key(plugin_name, resource_id),
+                task_id,
+                str(project_id),
+                int(lease),
+            )
+            if acquired:
+                return (True, task_id)
+            return (False, running_task_id.decode("utf-8"))
+
+        except Exception as e:
+            print(f"[InFlight.acquire] {e}")
+            tb1 = traceback.TracebackException.from_exception(e)
+            print("".join(tb1.format()))
+            return (True, task_id)
+
+    @staticmethod
+    def count():
+        """
+            Plugin tasks holding a lease, whoever launched them.
+            None if Redis is not reachable.
+        """
+        try:
+            client = RedisRegistry.get_client()
+            return sum(
+                1
+                for key in client.scan_iter(match="inflight:*", count=1000)
+                if not key.endswith(b":projects")
+            )
+
+        except Exception as e:
+            print(f"[InFlight.count] {e}")
+            tb1 = traceback.TracebackException.from_exception(e)
+            print("".join(tb1.format()))
+            return None
+
+    @staticmethod
+    def running(resource_ids):
+        """
+            [{plugin_name, resource_id, task_id}] of the leases held for resources
+        """
+        resource_ids = set(str(resource_id) for resource_id in resource_ids)
+        client = RedisRegistry.get_client()
+
+        leases = []
+        for key in client.scan_iter(match="inflight:*", count=1000):
+            key = key.decode("utf-8")
+            if key.endswith(":projects"):
+                continue
+            _, plugin_name, resource_id = key.split(":")
+            if resource_id in resource_ids:
+                leases.append((key, plugin_name, resource_id))
+
+        task_ids = client.mget([key for key, _, _ in leases]) if leases else []
+        return [
+            {
+                "plugin_name": plugin_name,
+                "resource_id": resource_id,
+                "task_id": task_id.decode("utf-8"),
+            }
+            for (key, plugin_name, resource_id), task_id in zip(leases, task_ids)
+            if task_id
+        ]
+
+    @staticmethod
+    def mark_revoked(task_ids):
+        pipeline = RedisRegistry.get_client().pipeline()
+        for task_id in task_ids:
+            pipeline.set(_revoked_key(task_id), 1, ex=REVOKED_RETENTION)
+        pipeline.execute()
+
+    @staticmethod
+    def is_revoked(task_id):
+        try:
+            return bool(RedisRegistry.get_client().exists(_revoked_key(task_id)))
+
+        except Exception as e:
+            print(f"[InFlight.is_revoked] {e}")
+            return False
+
+    @staticmethod
+    def release(plugin_name, resource_id, task_id):
+        """
+            Drop the lease if task_id still holds it, returns the ids of the
+            projects waiting for the results. A lease that expired and was taken
+            by a newer task is left alone.
+        """
+        try:
+            client = RedisRegistry.get_client()
+            waiting = client.eval(
+                RELEASE_SCRIPT,
+                2,
+                _key(plugin_name, resource_id),
+                _waiting_key(plugin_name, resource_id),
+                task_id,
+            )
+
+            return [project_id.decode("utf-8") for project_id in waiting]
+
+        except Exception as e:
+            print(f"[InFlight.release] {e}")
+            tb1 = traceback.TracebackException.from_exception(e)
+            print("".join(tb1.format()))
+            return []
@@ -0,0 +1,175 @@
+import random
+import re
+import time
+
+from server.entities.resource_types import ResourceType
+
+# Building blocks, kept close to the "validators" package rules we used before
+OCTET = r"(?:25[0-5]|2[0-4][0-9]|[01]?[0-9]?[0-9])"
+IPV4 = rf"{OCTET}(?:\.{OCTET}){{3}}"
+LABEL = r"[A-Za-z0-9](?:[A-Za-z0-9_-]{0,61}[A-Za-z0-9])?"
+DOMAIN = rf"(?:{LABEL}\.)+[A-Za-z0-9][A-Za-z0-9_-]{{0,61}}[A-Za-z]"
+LOCAL_PART = r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(?:\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*"
+EMAIL = rf"{LOCAL_PART}@{DOMAIN}"
+URL = (
+    rf"(?:https?|ftp)://(?:[^\s:@/]+(?::[^\s@/]*)?@)?"
+    rf"(?:{DOMAIN}|{IPV4}|localhost)(?::[0-9]{{2,5}})?(?:[/?#]\S*)?"
+)
+HASH = r"[A-Fa-f0-9]{32}|[A-Fa-f0-9]{40}|[A-Fa-f0-9]{64}|[A-Fa-f0-9]{128}"
+
+# Group order is the precedence ResourceType.validate always had.
+# Usernames are checked last, as the local part of a contrived email.
+CLASSIFIER = re.compile(
+    rf"(?P<ip>{IPV4})|(?P<domain>{DOMAIN})|(?P<url>{URL})|(?P<email>{EMAIL})"
+    rf"|(?P<hash>{HASH})|(?P<username>{LOCAL_PART})"
+)
+
+GROUP_TYPES = {
+    "ip": ResourceType.IPv4,
+    "domain": ResourceType.DOMAIN,
+    "url": ResourceType.URL,
+    "email": ResourceType.EMAIL,
+    "hash": ResourceType.HASH,
+    "username": ResourceType.USERNAME,
+}
+
+# Defanged notations seen in reports: evil[.]com, hxxp://, user[@]domain...
+FANGS = re.compile(
+    r"\[\.\]|\(\.\)|\{\.\}|\[dot\]|\(dot\)|\[:\]|\[://\]|\[@\]|\[at\]|\(at\)|hxxp|h\[tt\]p|fxp",
+    re.IGNORECASE,
+)
+REFANG = {
+    "[.]": ".",
+    "(.)": ".",
+    "{.}": ".",
+    "[dot]": ".",
+    "(dot)": ".",
+    "[:]": ":",
+    "[://]": "://",
+    "[@]": "@",
+    "[at]": "@",
+    "(at)": "@",
+    "hxxp": "http",
+    "h[tt]p": "http",
+    "fxp": "ftp",
+}
+
+# Characters wrapping indicators in prose: "(see evil.com)," or "<http://...>"
+STRIP_CHARS = ".,;:!?()[]{}<>'\"`"
+
+# Free text is full of "file.exe" or "report.pdf" which look like domains
+FILE_EXTENSIONS = set(
+    "exe dll sys bat ps1 vbs js jar apk bin doc docx docm xls xlsx xlsm ppt pptx "
+    "pdf rtf txt log csv json xml ini cfg dat tmp zip rar gz tar 7z iso img lnk "
+    "hta py sh png jpg jpeg gif bmp htm html php asp aspx".split()
+)
+
+# Kinds of indicators extracted from free text. Usernames are not: every word would be one
+EXTRACTED_TYPES = {
+    ResourceType.IPv4,
+    ResourceType.DOMAIN,
+    ResourceType.URL,
+    ResourceType.EMAIL,
+    ResourceType.HASH,
+}
+
+
+def classify(resource):
+    """
+        Single pass classification of one indicator
+    """
+    match = CLASSIFIER.fullmatch(resource)
+    if not match:
+        return ResourceType.UNKNOWN
+    return GROUP_TYPES[match.lastgroup]
+
+
+def refang(text):
+    if not FANGS.search(text):
+        return text
+    return FANGS.sub(lambda match: REFANG[match.group().lower()], text)
+
+
+def _is_candidate(token):
+    return "." in token or "@" in token or len(token) >= 32
+
+
+def _may_be_fanged(token):
+    return "[" in token or "(" in token or "{" in token or "xp" in token.lower()
+
+
+def extract(text):
+    """
+        Refang a free text blob (report, paste...) and return every indicator
+        found in it as a list of (name, ResourceType), deduplicated and in order
+        of appearance
+    """
+    # Split and dedup run in C, only distinct tokens reach Python code.
+    # Refanging them one by one is far cheaper than rewriting the whole blob.
+    tokens = dict.fromkeys(text.split())
+
+    found = {}
+    for token in tokens:
+        if _may_be_fanged(token):
+            token = refang(token)
+
+        if not _is_candidate(token):
+            continue
+
+        token = token.strip(STRIP_CHARS)
+        if token in found or not _is_candidate(token):
+            continue
+
+        resource_type = classify(token)
+        if not resource_type in EXTRACTED_TYPES:
+            continue
+
+        if (
+            resource_type == ResourceType.DOMAIN
+            and token.rsplit(".", 1)[-1].lower() in FILE_EXTENSIONS
+        ):
+            continue
+
+        found[token] = resource_type
+
+    return list(found.items())
+
+
+def benchmark(size_mb=20, seed=0):
+    """
+        Extraction throughput over a synthetic report, in MB/s
+    """
+    words = (
+        "the sample connects to evil[.]example[.]com and 10.20.30.40 with hash "
+        "d41d8cd98f00b204e9800998ecf8427e hxxp://bad.example.org/path?x=1 contact "
+        "bob@corp.example dropping invoice.exe lorem ipsum dolor sit amet, "
+        "consectetur adipiscing elit. version 1.2.3"
+    ).split()
+    rng = random.Random(seed)
+
+    # Unique indicators too, so the dedup cache does not hide classification cost
+    chunks = []
+    size = 0
+    while size < size_mb * 1000000:
+        chunk = " ".join(rng.choice(words) for _ in range(64))
+        chunk += (
+            f" host{rng.randrange(10 ** 6)}.example.net {rng.getrandbits(128):032x}\n"
+        )
+        chunks.append(chunk)
+        size += len(chunk)
+    text = "".join(chunks)
+
+    start = time.perf_counter()
+    indicators = extract(text)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "size_mb": len(text) / 1000000,
+        "indicators": len(indicators),
+        "seconds": elapsed,
+        "mb_per_second": len(text) / 1000000 / elapsed,
+    }
+
+
+if __name__ == "__main__":
+    print(f"[ioc_classifier.benchmark]: {benchmark()}")
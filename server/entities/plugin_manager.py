@@ -1,5 +1,3 @@
-import os
-import importlib
 import traceback
 import pymongo
 import time
@@ -8,65 +6,81 @@ import hashlib
 import json
 import difflib
 import pprint
+import uuid
 
+from celery import group, current_task
+
+from tasks.tasks import celery_app
+from tasks.queues import QUEUES, DEFAULT_QUEUE, TIME_LIMIT_GRACE, plugin_time_limit
 from server.db import DB
 from server.entities.resource_types import ResourceType
 from server.entities.plugin_result_types import PluginResultStatus
+from server.entities.plugin_registry import PluginRegistry
+from server.entities.plugin_manifest import get_manifests
 from server.entities.update_central import UpdateCentral
+from server.entities.quota_ledger import LaunchBudget
+from server.entities.inflight import InFlight
+from server.entities.plugin_runs import PluginRuns
+
 
+# Max signatures sent in a single celery group
+LAUNCH_GROUP_SIZE = 500
 
-PLUGIN_DIRECTORY = "server/plugins/"
-PLUGIN_HIERARCHY = "server.plugins"
-EXCLUDE_SET = ["__init__.py", "TEMPLATE.py"]
+# Stored results that can be served instead of launching a plugin again
+FRESH_RESULT_STATUSES = [
+    PluginResultStatus.COMPLETED,
+    PluginResultStatus.RETURN_NONE,
+    PluginResultStatus.JUST_UPDATED,
+]
 
 
-def _get_module_names():
+def _apikeys_in_ddbb(manifest, stored_apikeys):
     """
-        Get all the plugins names to load on
+        Computed from the apikeys collection, as the plugins did at import time
     """
-    plugins = []
-    for root, dirs, files in os.walk("server/plugins"):
-        for file in files:
-            if ".py" in file[-3:] and not file in EXCLUDE_SET:
-                plugins.append("server.plugins.{}".format(os.path.splitext(file)[0]))
-    return plugins
+    if not manifest["PLUGIN_NEEDS_API_KEY"] or not manifest["API_KEY_NAMES"]:
+        return False
+    return all(name in stored_apikeys for name in manifest["API_KEY_NAMES"])
 
 
 def register_plugins():
     """
         This function register metadata from enabled plugins upon container startup
+        Metadata is read from the plugin manifests, plugin modules are not imported
     """
     db = DB("plugins")
     db.collection.delete_many({})
 
-    for module in _get_module_names():
-        module = importlib.import_module(module)
-        if not module.PLUGIN_DISABLE:
-            print(f"registering {module.PLUGIN_NAME}")
+    stored_apikeys = set(
+        apikey["name"] for apikey in DB("apikeys").collection.find({}, {"name": 1})
+    )
+
+    for manifest in get_manifests():
+        if not manifest["PLUGIN_DISABLE"]:
+            print(f"registering {manifest['PLUGIN_NAME']}")
             db.collection.insert_one(
                 {
-                    "name": module.PLUGIN_NAME,
-                    "is_active": module.PLUGIN_IS_ACTIVE,
-                    "description": module.PLUGIN_DESCRIPTION,
-                    "autostart": module.PLUGIN_AUTOSTART,
-                    "target": [resource.value for resource in module.RESOURCE_TARGET],
-                    "needs_apikey": module.PLUGIN_NEEDS_API_KEY,
-                    "apikey_in_ddbb": module.API_KEY_IN_DDBB,
-                    "apikey_doc": module.API_KEY_DOC,
-                    "apikey_names": module.API_KEY_NAMES,
+                    "name": manifest["PLUGIN_NAME"],
+                    "is_active": manifest["PLUGIN_IS_ACTIVE"],
+                    "description": manifest["PLUGIN_DESCRIPTION"],
+                    "autostart": manifest["PLUGIN_AUTOSTART"],
+                    "target": [
+                        resource.value for resource in manifest["RESOURCE_TARGET"]
+                    ],
+                    "needs_apikey": manifest["PLUGIN_NEEDS_API_KEY"],
+                    "apikey_in_ddbb": _apikeys_in_ddbb(manifest, stored_apikeys),
+                    "apikey_doc": manifest["API_KEY_DOC"],
+                    "apikey_names": manifest["API_KEY_NAMES"],
+                    "task": f"{manifest['MODULE']}.{manifest['PLUGIN_TASK']}",
+                    "task_target": manifest["PLUGIN_TASK_TARGET"],
+                    "queue": manifest["PLUGIN_QUEUE"],
+                    "freshness": manifest["PLUGIN_FRESHNESS"],
+                    "time_limit": plugin_time_limit(manifest),
                 }
             )
 
-
-def _load_module(plugin_name):
-    try:
-        module = importlib.import_module(f"{PLUGIN_HIERARCHY}.{plugin_name}")
-        return module
-
-    except Exception as e:
-        print(f"[_load_module] {e}")
-        tb1 = traceback.TracebackException.from_exception(e)
-        print("".join(tb1.format()))
+    # Every process reloads its plugin registry
+    PluginRegistry.bump()
 
 
 class PluginManager:
@@ -78,19 +92,7 @@ class PluginManager:
     @staticmethod
     def get_plugin_names():
         try:
-            db = DB("plugins")
-            plugins = db.collection.find({"needs_apikey": True})
-
-            non_apikeys_fields = []
-            for plugin in plugins:
-                non_apikeys_fields.extend(plugin["apikey_names"])
-
-            db = DB("apikeys")
-            apikeys = [apikey["name"] for apikey in db.collection.find({})]
-
-            non_apikeys_fields = set(non_apikeys_fields) - set(apikeys)
-
-            return list(non_apikeys_fields)
+            return PluginRegistry.missing_apikeys()
 
         except Exception as e:
             print(f"[PluginManager.get_plugin_names] {e}")
@@ -100,10 +102,7 @@ class PluginManager:
     @staticmethod
     def get_autostart_plugins_for_resource(resource_type_as_string):
         try:
-            db = DB("plugins")
-            plugins = db.collection.find(
-                {"autostart": True, "target": resource_type_as_string}
-            )
+            plugins = PluginRegistry.autostart_for_type(resource_type_as_string)
             return [plugin["name"] for plugin in plugins]
 
         except Exception as e:
@@ -112,13 +111,88 @@ class PluginManager:
             print("".join(tb1.format()))
 
     @staticmethod
-    def get_plugins_for_resource(resource_type_as_string):
-        db = DB("plugins")
-        plugins = db.collection.find({"target": resource_type_as_string}).sort(
-            [("name", pymongo.ASCENDING)]
+    def get_autostart_plugin_docs_for_resource(resource_type_as_string):
+        return PluginRegistry.autostart_for_type(resource_type_as_string)
+
+    @staticmethod
+    def get_plugin_doc(plugin_name):
+        return PluginRegistry.get(plugin_name)
+
+    @staticmethod
+    def signature(plugin, resource, project_id):
+        """
+            Celery signature of a registered plugin task for a resource.
+            Built from the plugin metadata, the plugin module is not imported.
+        """
+        kwargs = {
+            argument: resource.get_field(field)
+            for argument, field in plugin["task_target"].items()
+        }
+        kwargs.update(
+            {
+                "resource_id": resource.get_id_as_string(),
+                "project_id": project_id,
+                "resource_type": resource.get_type_value(),
+                "plugin_name": plugin["name"],
+            }
         )
+        return celery_app.signature(plugin["task"], kwargs=kwargs)
+
+    @staticmethod
+    def launch_autostart_bulk(resources, project_id):
+        """
+            Launch the autostart plugins of many resources as celery groups.
+            Low priority work: launches of plugins whose provider quota is close to
+            exhausted are dropped.
+            Returns (ids of the sent groups, {plugin_name: dropped launches})
+        """
+        plugins_by_type = {}
+        signatures = []
+        budget = LaunchBudget()
+
+        for resource in resources:
+            resource_type = resource.get_type_value()
+            if not resource_type in plugins_by_type:
+                plugins_by_type[
+                    resource_type
+                ] = PluginManager.get_autostart_plugin_docs_for_resource(resource_type)
+
+            manager = PluginManager(resource, project_id)
+            for plugin in plugins_by_type[resource_type]:
+                if budget.take(plugin):
+                    task_id = manager.acquire_flight(plugin)
+                    if task_id:
+                        signatures.append(
+                            PluginManager.signature(plugin, resource, project_id).set(
+                                task_id=task_id
+                            )
+                        )
+
+        group_ids = []
+        for index in range(0, len(signatures), LAUNCH_GROUP_SIZE):
+            try:
+                result = group(
+                    signatures[index : index + LAUNCH_GROUP_SIZE]
+                ).apply_async()
+            except Exception:
+                # Nothing will run the unsent tasks, their leases go now
+                PluginManager.release_flights(signatures[index:])
+                raise
+            group_ids.append(result.id)
+
+        print(
+            f"[PluginManager.launch_autostart_bulk]: Sent {len(signatures)} tasks in {len(group_ids)} groups"
+        )
+        if budget.dropped:
+            print(
+                f"[PluginManager.launch_autostart_bulk]: Dropped by quota {budget.dropped}"
+            )
+        return (group_ids, budget.dropped)
+
+    @staticmethod
+    def get_plugins_for_resource(resource_type_as_string):
         results = []
-        for entry in plugins:
+        for entry in PluginRegistry.for_type(resource_type_as_string):
             results.append(
                 {
                     "name": entry["name"],
@@ -131,16 +205,15 @@ class PluginManager:
             )
         return results
 
+    @staticmethod
+    def is_registered(plugin_name):
+        return PluginRegistry.get(plugin_name) is not None
+
     @staticmethod
     def get_plugins_names_for_resource(resource_type_as_string):
-        db = DB("plugins")
-        plugins = db.collection.find({"target": resource_type_as_string}).sort(
-            [("name", pymongo.ASCENDING)]
-        )
-        results = []
-        for entry in plugins:
-            results.append(entry["name"])
-        return results
+        return [
+            entry["name"] for entry in PluginRegistry.for_type(resource_type_as_string)
+        ]
 
     def __init__(self, resource, project_id):
         self.resource = resource
@@ -150,36 +223,194 @@ class PluginManager:
     def launch_all(self, profile="pasive"):
         """
             Launch all the loaded plugins based on a profile (by default non active or noisy modules)
+            Tasks are sent by their registered name as a single celery group,
+            returns the group id so the client can track it
         """
         try:
-            plugins = PluginManager.get_autostart_plugins_for_resource(
+            plugins = PluginManager.get_autostart_plugin_docs_for_resource(
                 self.resource.get_type_value()
             )
-            name_list = " ".join(plugins)
+            name_list = " ".join([plugin["name"] for plugin in plugins])
             print(
                 f"[PluginManager.launch_all]: Launching autostart plugins...{name_list}"
             )
 
+            # Autostart is low priority work, it does not spend the last of a quota
+            budget = LaunchBudget()
+            signatures = []
             for plugin in plugins:
-                module = _load_module(plugin)
-                module.Plugin(self.resource, self.project_id).do()
+                if budget.take(plugin):
+                    task_id = self.acquire_flight(plugin)
+                    if task_id:
+                        signatures.append(
+                            PluginManager.signature(
+                                plugin, self.resource, self.project_id
+                            ).set(task_id=task_id)
+                        )
+                else:
+                    UpdateCentral().set_pending_update(
+                        self.project_id,
+                        self.resource.get_id_as_string(),
+                        plugin["name"],
+                        PluginResultStatus.QUOTA_EXCEEDED,
+                    )
+
+            if not signatures:
+                return None
+
+            try:
+                return group(signatures).apply_async().id
+            except Exception:
+                PluginManager.release_flights(signatures)
+                raise
 
         except Exception as e:
             print(f"[PluginManager.launch_all] {e}")
             tb1 = traceback.TracebackException.from_exception(e)
             print("".join(tb1.format()))
 
-    def launch(self, plugin_name):
+    def has_fresh_result(self, plugin):
+        """
+            True if the latest result of the plugin for this resource is inside
+            the plugin freshness window
+        """
+        freshness = plugin.get("freshness", 0)
+        if not freshness:
+            return False
+
+        latest = DB(plugin["name"]).collection.find_one(
+            {
+                "resource_id": bson.ObjectId(self.resource.get_id_as_string()),
+                "timestamp": {"$gte": time.time() - freshness},
+            },
+            {"result_status": 1},
+            sort=[("timestamp", pymongo.DESCENDING)],
+        )
+        if not latest:
+            return False
+
+        # Tuple values of the enum are stored as lists: (1,) -> [1]
+        status = latest.get("result_status")
+        status = tuple(status) if isinstance(status, list) else status
+        return status in [fresh.value for fresh in FRESH_RESULT_STATUSES]
+
+    def acquire_flight(self, plugin):
+        """
+            Task id to launch the plugin with, None if the same plugin is already
+            running for this resource: this project then waits for its results
+        """
+        task_id = str(uuid.uuid4())
+        # The lease outlives the task, even when it runs up to its hard time limit
+        lease = max(
+            QUEUES[plugin.get("queue", DEFAULT_QUEUE)]["lease"],
+            plugin.get("time_limit", 0) + TIME_LIMIT_GRACE,
+        )
+        acquired, running_task_id = InFlight.acquire(
+            plugin["name"],
+            self.resource.get_id_as_string(),
+            task_id,
+            self.project_id,
+            lease,
+        )
+        if not acquired:
+            print(f"{plugin['name']} already running as {running_task_id}")
+            return None
+        return task_id
+
+    def launch(self, plugin_name, force=False):
+        """
+            Launch a single plugin by its registered task name, returns the task id.
+            Inside the plugin freshness window the latest stored result is served
+            instead: no task is sent and None is returned, unless force is set.
+        """
         try:
-            module = _load_module(plugin_name)
-            print(f"Launching {module.PLUGIN_NAME}")
-            return module.Plugin(self.resource, self.project_id).do()
+            plugin = PluginManager.get_plugin_doc(plugin_name)
+
+            if not force and self.has_fresh_result(plugin):
+                print(f"Serving fresh {plugin['name']} result")
+                UpdateCentral().set_pending_update(
+                    self.project_id,
+                    self.resource.get_id_as_string(),
+                    plugin["name"],
+                    PluginResultStatus.JUST_UPDATED,
+                )
+                return None
+
+            task_id = self.acquire_flight(plugin)
+            if not task_id:
+                return None
+
+            print(f"Launching {plugin['name']}")
+            try:
+                return (
+                    PluginManager.signature(plugin, self.resource, self.project_id)
+                    .apply_async(task_id=task_id)
+                    .id
+                )
+            except Exception:
+                # Nothing will run the task, the lease goes now
+                InFlight.release(
+                    plugin["name"], self.resource.get_id_as_string(), task_id
+                )
+                raise
 
         except Exception as e:
             print(f"[PluginManager.launch] {e}")
             tb1 = traceback.TracebackException.from_exception(e)
             print("".join(tb1.format()))
 
+    @staticmethod
+    def release_flights(signatures):
+        """
+            Drop the in-flight leases of plugin task signatures that were not sent
+        """
+        for signature in signatures:
+            InFlight.release(
+                signature.kwargs["plugin_name"],
+                signature.kwargs["resource_id"],
+                signature.options["task_id"],
+            )
+
+    @staticmethod
+    def revoke_tasks(resource_ids):
+        """
+            Stop the plugin tasks running for some resources. Running tasks get
+            SIGUSR1, as on their soft time limit, so they store their partial
+            results with a TIMEOUT status. Returns the revoked tasks.
+        """
+        tasks = InFlight.running(resource_ids)
+        if not tasks:
+            return []
+
+        task_ids = [task["task_id"] for task in tasks]
+        InFlight.mark_revoked(task_ids)
+        celery_app.control.revoke(task_ids, terminate=True, signal="SIGUSR1")
+
+        # Queued tasks are dropped without running, their leases go now
+        for task in tasks:
+            InFlight.release(task["plugin_name"], task["resource_id"], task["task_id"])
+
+        print(f"[PluginManager.revoke_tasks]: Revoked {len(task_ids)} tasks")
+        return tasks
+
+    @staticmethod
+    def set_timeout_result(resource_id, plugin_name, project_id, started_at):
+        """
+            Store a TIMEOUT result for a task stopped by its time limit (or revoked)
+            which did not store anything itself since started_at
+        """
+        latest = DB(plugin_name).collection.find_one(
+            {
+                "resource_id": bson.ObjectId(resource_id),
+                "timestamp": {"$gte": started_at},
+            },
+            {"_id": 1},
+        )
+        if not latest:
+            PluginManager.set_plugin_results(
+                resource_id, plugin_name, project_id, None, PluginResultStatus.TIMEOUT
+            )
+
     @staticmethod
     def set_plugin_results(
         resource_id,
@@ -187,7 +418,16 @@ class PluginManager:
         project_id,
         query_result,
         result_status=PluginResultStatus.COMPLETED,
+        task_id=None,
     ):
+        """
+            task_id is the task holding the in-flight lease of the run, the run
+            of the running task by default
+        """
+        if not task_id:
+            task_id = PluginRuns.context.task_id
+        if not task_id and current_task:
+            task_id = current_task.request.id
 
         db = DB(plugin_name)
 
@@ -245,6 +485,19 @@ class PluginManager:
             project_id, resource_id, plugin_name, result_status,
         )
 
+        # Final status of the run in the plugin_runs ledger
+        PluginRuns.set_result_status(result_status)
+
+        # Launches coalesced onto this task are notified too
+        waiting_project_ids = (
+            InFlight.release(plugin_name, resource_id, task_id) if task_id else []
+        )
+        for waiting_project_id in waiting_project_ids:
+            if not waiting_project_id == str(project_id):
+                UpdateCentral().set_pending_update(
+                    waiting_project_id, resource_id, plugin_name, result_status,
+                )
+
     @staticmethod
     def get_diff(plugin_name, resource_id, index):
         try:
@@ -0,0 +1,107 @@
+import ast
+import os
+import traceback
+
+from server.entities.resource_types import ResourceType
+from tasks.queues import DEFAULT_QUEUE, get_worker_queues
+
+PLUGIN_DIRECTORY = "server/plugins"
+PLUGIN_HIERARCHY = "server.plugins"
+EXCLUDE_SET = ["__init__.py", "TEMPLATE.py"]
+
+# Module level constants every plugin declares as literals
+MANIFEST_FIELDS = [
+    "PLUGIN_AUTOSTART",
+    "PLUGIN_DESCRIPTION",
+    "PLUGIN_DISABLE",
+    "PLUGIN_IS_ACTIVE",
+    "PLUGIN_NAME",
+    "PLUGIN_NEEDS_API_KEY",
+    "PLUGIN_TASK",
+    "PLUGIN_TASK_TARGET",
+    "PLUGIN_QUEUE",
+    "PLUGIN_FRESHNESS",
+    "PLUGIN_TIME_LIMIT",
+    "API_KEY_DOC",
+    "API_KEY_NAMES",
+]
+
+# Environment variable restricting the plugin modules a celery worker imports,
+# a comma separated list of plugin names. Every enabled plugin when unset.
+# Workers also skip the plugins of queues they do not consume (tasks/queues.py)
+WORKER_PLUGINS_ENV = "THETHE_WORKER_PLUGINS"
+
+
+def _resource_target(node):
+    """
+        RESOURCE_TARGET is a list of ResourceType members: [ResourceType.IPv4, ...]
+    """
+    return [getattr(ResourceType, element.attr) for element in node.elts]
+
+
+def read_manifest(path):
+    """
+        Read the metadata of a plugin file without importing it.
+        Plugins declare their PLUGIN_* constants as literals, so parsing the
+        module is enough and none of its dependencies or KeyRing queries run.
+    """
+    with open(path, "r") as f:
+        tree = ast.parse(f.read(), filename=path)
+
+    manifest = {
+        "PLUGIN_QUEUE": DEFAULT_QUEUE,
+        "PLUGIN_FRESHNESS": 0,
+        "PLUGIN_TIME_LIMIT": None,
+    }
+    for node in tree.body:
+        if not isinstance(node, ast.Assign):
+            continue
+
+        for target in node.targets:
+            if not isinstance(target, ast.Name):
+                continue
+
+            if target.id == "RESOURCE_TARGET":
+                manifest[target.id] = _resource_target(node.value)
+            elif target.id in MANIFEST_FIELDS:
+                manifest[target.id] = ast.literal_eval(node.value)
+
+    module_name = os.path.splitext(os.path.basename(path))[0]
+    manifest["MODULE"] = f"{PLUGIN_HIERARCHY}.{module_name}"
+    return manifest
+
+
+def get_manifests():
+    """
+        Manifests of every plugin file, disabled ones included
+    """
+    manifests = []
+    for root, dirs, files in os.walk(PLUGIN_DIRECTORY):
+        for file in sorted(files):
+            if ".py" in file[-3:] and not file in EXCLUDE_SET:
+                try:
+                    manifests.append(read_manifest(os.path.join(root, file)))
+
+                except Exception as e:
+                    print(f"[plugin_manifest.get_manifests] {file}: {e}")
+                    tb1 = traceback.TracebackException.from_exception(e)
+                    print("".join(tb1.format()))
+
+    return manifests
+
+
+def get_worker_modules(manifests):
+    """
+        Plugin modules a celery worker has to import, see WORKER_PLUGINS_ENV
+    """
+    selected = os.environ.get(WORKER_PLUGINS_ENV)
+    selected = set(name.strip() for name in selected.split(",")) if selected else None
+    queues = get_worker_queues()
+
+    return [
+        manifest["MODULE"]
+        for manifest in manifests
+        if not manifest["PLUGIN_DISABLE"]
+        and manifest["PLUGIN_QUEUE"] in queues
+        and (selected is None or manifest["PLUGIN_NAME"] in selected)
+    ]
@@ -0,0 +1,144 @@
+import threading
+import time
+import traceback
+
+import pymongo
+
+from server.db import DB
+
+# Single document holding the version of the "plugins" and "apikeys" metadata
+REGISTRY_VERSION_COLLECTION = "plugins_version"
+REGISTRY_VERSION_ID = "plugins"
+
+# How often a process checks whether the registry version changed, in seconds
+REGISTRY_CHECK_INTERVAL = 5
+
+
+class PluginRegistry:
+    """
+        Process cache of the registered plugins metadata, indexed by resource
+        type and autostart flag.
+        Plugins only change when register_plugins() runs or API keys are uploaded,
+        both bump a version counter in Mongo. Every process compares its loaded
+        version with that counter at most once per REGISTRY_CHECK_INTERVAL and
+        reloads everything when it moved.
+    """
+
+    _lock = threading.Lock()
+    _version = None
+    _checked_at = 0
+
+    _by_name = {}
+    _by_type = {}
+    _autostart_by_type = {}
+    _missing_apikeys = []
+
+    @classmethod
+    def _current_version(cls):
+        doc = DB(REGISTRY_VERSION_COLLECTION).collection.find_one(
+            {"_id": REGISTRY_VERSION_ID}
+        )
+        return doc["version"] if doc else 0
+
+    @classmethod
+    def _load(cls, version):
+        plugins = list(
+            DB("plugins")
+            .collection.find({}, {"_id": False})
+            .sort([("name", pymongo.ASCENDING)])
+        )
+
+        by_name = {}
+        by_type = {}
+        autostart_by_type = {}
+        needed_apikeys = set()
+
+        for plugin in plugins:
+            by_name[plugin["name"]] = plugin
+            for resource_type in plugin["target"]:
+                by_type.setdefault(resource_type, []).append(plugin)
+                if plugin["autostart"]:
+                    autostart_by_type.setdefault(resource_type, []).append(plugin)
+            if plugin["needs_apikey"]:
+                needed_apikeys.update(plugin["apikey_names"])
+
+        stored_apikeys = set(
+            apikey["name"] for apikey in DB("apikeys").collection.find({}, {"name": 1})
+        )
+
+        cls._by_name = by_name
+        cls._by_type = by_type
+        cls._autostart_by_type = autostart_by_type
+        cls._missing_apikeys = list(needed_apikeys - stored_apikeys)
+        cls._version = version
+
+    @classmethod
+    def _is_fresh(cls, now):
+        return (
+            cls._version is not None and now - cls._checked_at < REGISTRY_CHECK_INTERVAL
+        )
+
+    @classmethod
+    def refresh(cls):
+        now = time.time()
+        if cls._is_fresh(now):
+            return
+
+        with cls._lock:
+            if cls._is_fresh(now):
+                return
+
+            try:
+                version = cls._current_version()
+                if version != cls._version:
+                    cls._load(version)
+                cls._checked_at = now
+
+            except Exception as e:
+                print(f"[PluginRegistry.refresh] {e}")
+                tb1 = traceback.TracebackException.from_exception(e)
+                print("".join(tb1.format()))
+
+    @classmethod
+    def bump(cls):
+        """
+            Signal every process that plugins metadata changed
+        """
+        DB(REGISTRY_VERSION_COLLECTION).collection.update_one(
+            {"_id": REGISTRY_VERSION_ID}, {"$inc": {"version": 1}}, upsert=True
+        )
+        cls.reset()
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._version = None
+            cls._checked_at = 0
+
+    @classmethod
+    def get(cls, plugin_name):
+        cls.refresh()
+        return cls._by_name.get(plugin_name)
+
+    @classmethod
+    def all(cls):
+        cls.refresh()
+        return list(cls._by_name.values())
+
+    @classmethod
+    def for_type(cls, resource_type_as_string):
+        """
+            Plugins able to work with a resource type, sorted by name
+        """
+        cls.refresh()
+        return cls._by_type.get(resource_type_as_string, [])
+
+    @classmethod
+    def autostart_for_type(cls, resource_type_as_string):
+        cls.refresh()
+        return cls._autostart_by_type.get(resource_type_as_string, [])
+
+    @classmethod
+    def missing_apikeys(cls):
+        cls.refresh()
+        return list(cls._missing_apikeys)
@@ -9,3 +9,5 @@ class PluginResultStatus(Enum):
     FAILED = (3,)
     NO_API_KEY = (4,)
     JUST_UPDATED = 5
+    QUOTA_EXCEEDED = 6
+    TIMEOUT = 7
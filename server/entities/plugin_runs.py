@@ -0,0 +1,394 @@
+import datetime
+import math
+import threading
+import time
+import traceback
+
+import bson
+from pymongo import UpdateOne
+
+from server.db import DB
+from tasks.queues import QUEUES, DEFAULT_QUEUE
+
+# Run states stored in "status" until the run finishes with a PluginResultStatus
+RUN_QUEUED = "queued"
+RUN_RUNNING = "running"
+RUN_DEFERRED = "deferred"  # Rescheduled by the rate limiter or polling countdowns
+RUN_HANDED_OFF = "handed_off"  # Its work goes on in a follow-up task
+RUN_FINISHED = "finished"  # Ended without storing a result
+
+# Queued or running runs older than their queue lease are reported as lost
+RUN_LOST = "lost"
+
+# Runs are kept this long (TTL index on expires_at)
+RUNS_RETENTION = datetime.timedelta(days=30)
+
+
+# Numeric measures of finished runs summarised by PluginRuns.stats
+STATS_FIELDS = ["queue_wait", "run_time", "calls", "bytes"]
+STATS_PERCENTILES = {"p50": 0.5, "p95": 0.95}
+
+# BSON types of a stored measure, runs without it are left out of its percentiles
+NUMBER_TYPES = ["double", "int", "long", "decimal"]
+
+
+def percentile_rank(count, fraction):
+    """
+        Nearest-rank position (1-based) of a percentile among count sorted values
+    """
+    return max(1, math.ceil(fraction * count))
+
+
+class RunState:
+    """
+        What a run has done so far: outbound calls, bytes received and the status
+        of the result it stored. Shared by every thread working for the run
+        (fan-out pool threads, the asyncio loop and executor of async plugins)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.bytes = 0
+        self.result_status = None
+
+    def add(self, calls=0, received=0):
+        with self._lock:
+            self.calls += calls
+            self.bytes += received
+
+
+class RunContext(threading.local):
+    """
+        The run of the task running in this thread, or the run this thread is
+        attached to
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, task_id=None):
+        self.task_id = task_id
+        self.started_at = time.time()
+        self.state = RunState()
+
+    @property
+    def result_status(self):
+        return self.state.result_status
+
+    @result_status.setter
+    def result_status(self, result_status):
+        self.state.result_status = result_status
+
+    @property
+    def run(self):
+        """
+            (task_id, state) of the run of this thread, None outside of a run.
+            Hand it to attach() in the threads doing work for the run.
+        """
+        if self.task_id is None:
+            return None
+        return (self.task_id, self.state)
+
+    def attach(self, run):
+        self.reset()
+        if run:
+            self.task_id, self.state = run
+
+
+class PluginRuns:
+    """
+        Ledger of plugin task runs in the "plugin_runs" collection, one document
+        per celery task id, written when the task is sent, starts and finishes.
+        Follow-up tasks of a handed off run carry its task id as "run_id" and
+        write to the same document.
+    """
+
+    db = DB("plugin_runs")
+    context = RunContext()
+
+    @staticmethod
+    def enqueued(task_id, plugin_name, resource_id, project_id, queue, retries=0):
+        try:
+            if retries:
+                PluginRuns.db.collection.update_one(
+                    {"_id": task_id},
+                    {"$set": {"status": RUN_DEFERRED, "retries": retries}},
+                )
+                return
+
+            PluginRuns.db.collection.update_one(
+                {"_id": task_id},
+                {
+                    "$setOnInsert": {
+                        "plugin": plugin_name,
+                        "resource_id": bson.ObjectId(resource_id),
+                        "project_id": str(project_id),
+                        "queue": queue,
+                        "enqueued_at": time.time(),
+                        "status": RUN_QUEUED,
+                        "expires_at": datetime.datetime.utcnow() + RUNS_RETENTION,
+                    }
+                },
+                upsert=True,
+            )
+
+        except Exception as e:
+            print(f"[PluginRuns.enqueued] {e}")
+            tb1 = traceback.TracebackException.from_exception(e)
+            print("".join(tb1.format()))
+
+    @staticmethod
+    def started(task_id, worker):
+        PluginRuns.context.reset(task_id)
+        try:
+            PluginRuns.db.collection.update_one(
+                {"_id": task_id},
+                {
+                    "$set": {"status": RUN_RUNNING, "worker": worker},
+                    "$min": {"started_at": time.time()},
+                },
+            )
+
+        except Exception as e:
+            print(f"[PluginRuns.started] {e}")
+            tb1 = traceback.TracebackException.from_exception(e)
+            print("".join(tb1.format()))
+
+    @staticmethod
+    def count_call(provider, method, url, response, elapsed, error):
+        """
+            tasks.http_client metrics hook
+        """
+        context = PluginRuns.context
+        if context.task_id is None:
+            return
+
+        received = 0
+        if response is not None:
+            length = response.headers.get("Content-Length")
+            received = int(length) if length else len(response.content)
+        context.state.add(calls=1, received=received)
+
+    @staticmethod
+    def set_result_status(result_status):
+        if PluginRuns.context.task_id is not None:
+            PluginRuns.context.result_status = result_status
+
+    @staticmethod
+    def finished(task_id, state):
+        """
+            state is a run state (RUN_DEFERRED, RUN_HANDED_OFF) or None when the
+            task is done: the status of its stored result is used then
+        """
+        context = PluginRuns.context
+        try:
+            now = time.time()
+            update = {"status": state}
+            if not state:
+                result_status = context.result_status
+                update["status"] = result_status.name if result_status else RUN_FINISHED
+                update["finished_at"] = now
+
+                run = PluginRuns.db.collection.find_one(
+                    {"_id": task_id}, {"enqueued_at": 1, "started_at": 1}
+                )
+                if run and run.get("enqueued_at") and run.get("started_at"):
+                    update["queue_wait"] = run["started_at"] - run["enqueued_at"]
+
+            # Every attempt of a deferred task adds its run time, calls and bytes
+            PluginRuns.db.collection.update_one(
+                {"_id": task_id},
+                {
+                    "$set": update,
+                    "$inc": {
+                        "run_time": now - context.started_at,
+                        "calls": context.state.calls,
+                        "bytes": context.state.bytes,
+                    },
+                },
+            )
+
+        except Exception as e:
+            print(f"[PluginRuns.finished] {e}")
+            tb1 = traceback.TracebackException.from_exception(e)
+            print("".join(tb1.format()))
+
+        finally:
+            context.reset()
+
+    @staticmethod
+    def finished_batch(run_statuses):
+        """
+            Finish the runs handed off to a batch task, [(run_id, result_status)].
+            The run time, calls and bytes of the batch are split between them
+        """
+        context = PluginRuns.context
+        try:
+            if not run_statuses:
+                return
+
+            now = time.time()
+            share = len(run_statuses)
+            runs = PluginRuns.db.collection.find(
+                {"_id": {"$in": [run_id for run_id, _ in run_statuses]}},
+                {"enqueued_at": 1, "started_at": 1},
+            )
+            queue_waits = {
+                run["_id"]: run["started_at"] - run["enqueued_at"]
+                for run in runs
+                if run.get("enqueued_at") and run.get("started_at")
+            }
+
+            operations = []
+            for run_id, result_status in run_statuses:
+                update = {"status": result_status.name, "finished_at": now}
+                if run_id in queue_waits:
+                    update["queue_wait"] = queue_waits[run_id]
+                operations.append(
+                    UpdateOne(
+                        {"_id": run_id},
+                        {
+                            "$set": update,
+                            "$inc": {
+                                "run_time": (now - context.started_at) / share,
+                                "calls": context.state.calls / share,
+                                "bytes": context.state.bytes / share,
+                            },
+                        },
+                    )
+                )
+            PluginRuns.db.collection.bulk_write(operations, ordered=False)
+
+        except Exception as e:
+            print(f"[PluginRuns.finished_batch] {e}")
+            tb1 = traceback.TracebackException.from_exception(e)
+            print("".join(tb1.format()))
+
+        finally:
+            context.reset()
+
+    @staticmethod
+    def for_resource(resource_id, limit=50):
+        """
+            Latest runs of a resource, queued or running ones past their queue
+            lease are reported as lost
+        """
+        now = time.time()
+        runs = (
+            PluginRuns.db.collection.find(
+                {"resource_id": bson.ObjectId(resource_id)},
+                {"expires_at": 0, "resource_id": 0},
+            )
+            .sort([("enqueued_at", -1)])
+            .limit(limit)
+        )
+
+        result = []
+        for run in runs:
+            run["task_id"] = run.pop("_id")
+            lease = QUEUES.get(run.get("queue"), QUEUES[DEFAULT_QUEUE])["lease"]
+            since = run.get("started_at") or run["enqueued_at"]
+            if run["status"] in [RUN_QUEUED, RUN_RUNNING] and now - since > lease:
+                run["status"] = RUN_LOST
+            result.append(run)
+        return result
+
+    @staticmethod
+    def stats(since):
+        """
+            Per plugin: runs, statuses and p50/p95 of queue wait, run time, calls and
+            bytes of the runs finished after since. Percentiles are picked by
+            position from the sorted values in the database, so no value list is
+            ever built in memory.
+        """
+        match = {"finished_at": {"$gte": since}}
+        groups = PluginRuns.db.collection.aggregate(
+            [
+                {"$match": match},
+                {
+                    "$group": {
+                        "_id": {"plugin": "$plugin", "status": "$status"},
+                        "runs": {"$sum": 1},
+                        "workers": {"$addToSet": "$worker"},
+                        **{
+                            field: {
+                                "$sum": {
+                                    "$cond": [
+                                        {"$in": [{"$type": f"${field}"}, NUMBER_TYPES]},
+                                        1,
+                                        0,
+                                    ]
+                                }
+                            }
+                            for field in STATS_FIELDS
+                        },
+                    }
+                },
+            ],
+            allowDiskUse=True,
+        )
+
+        by_plugin = {}
+        for group in groups:
+            plugin_name = group["_id"]["plugin"]
+            plugin_stats = by_plugin.setdefault(
+                plugin_name,
+                {
+                    "plugin": plugin_name,
+                    "runs": 0,
+                    "statuses": {},
+                    "workers": set(),
+                    "counts": {field: 0 for field in STATS_FIELDS},
+                },
+            )
+            plugin_stats["runs"] += group["runs"]
+            plugin_stats["statuses"][group["_id"]["status"]] = group["runs"]
+            plugin_stats["workers"].update(group["workers"])
+            for field in STATS_FIELDS:
+                plugin_stats["counts"][field] += group[field]
+
+        stats = []
+        for plugin_name in sorted(by_plugin):
+            plugin_stats = by_plugin[plugin_name]
+            counts = plugin_stats.pop("counts")
+            plugin_stats["workers"] = list(plugin_stats["workers"])
+            for field in STATS_FIELDS:
+                plugin_stats[field] = PluginRuns._percentiles(
+                    {**match, "plugin": plugin_name}, field, counts[field]
+                )
+            stats.append(plugin_stats)
+
+        return stats
+
+    @staticmethod
+    def _percentiles(match, field, count):
+        """
+            {"p50", "p95"} of a field among the runs matching match, count of which
+            have the field
+        """
+        if not count:
+            return {name: None for name in STATS_PERCENTILES}
+
+        picks = PluginRuns.db.collection.aggregate(
+            [
+                {"$match": {**match, field: {"$type": "number"}}},
+                {"$sort": {field: 1}},
+                {
+                    "$facet": {
+                        name: [
+                            {"$skip": percentile_rank(count, fraction) - 1},
+                            {"$limit": 1},
+                            {"$project": {"_id": 0, field: 1}},
+                        ]
+                        for name, fraction in STATS_PERCENTILES.items()
+                    }
+                },
+            ],
+            allowDiskUse=True,
+        )
+        picks = next(picks, {})
+        return {
+            name: picks[name][0][field] if picks.get(name) else None
+            for name in STATS_PERCENTILES
+        }
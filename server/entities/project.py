@@ -88,6 +88,17 @@ class Project:
             {"_id": self.project_id}, {"$addToSet": {"resource_refs": data}}
         )
 
+    def add_resources(self, resources):
+        data = [
+            {"resource_id": resource.resource_id, "resource_type": resource.get_type_value()}
+            for resource in resources
+        ]
+
+        self.db.collection.update_one(
+            {"_id": self.project_id},
+            {"$addToSet": {"resource_refs": {"$each": data}}},
+        )
+
     def get_resource(self, resource_id):
         return self.db.collection.find_one(
             {"_id": self.project_id, "resource_refs.resource_id": resource_id},
@@ -0,0 +1,203 @@
+import datetime
+import hashlib
+import time
+import traceback
+
+from server.db import DB
+
+# Quotas per provider (API key name) and key tier: [(window, limit)]
+# Windows are calendar ones, "day" and "month" (UTC). The tier is the "tier"
+# field stored with the key through /api/upload_apikeys, as for rate limits.
+QUOTAS = {
+    "virustotal": {
+        "default": [("day", 500), ("month", 15500)],
+        "premium": [("day", 20000)],
+    },
+    "hunterio": {"default": [("month", 25)], "starter": [("month", 500)]},
+    "ipstack": {"default": [("month", 100)], "basic": [("month", 50000)]},
+    "shodan": {"default": [("month", 100)]},
+}
+
+DEFAULT_TIER = "default"
+
+WINDOW_FORMATS = {"day": "%Y-%m-%d", "month": "%Y-%m"}
+
+# Ledger entries are kept a bit longer than the longest window (TTL index)
+LEDGER_RETENTION = datetime.timedelta(days=40)
+
+# Share of every window kept for interactive launches: autostart and bulk
+# launches stop once only this fraction of the quota is left
+LOW_PRIORITY_RESERVE = 0.2
+
+PRIORITY_HIGH = "high"
+PRIORITY_LOW = "low"
+
+
+def _key_id(apikey):
+    """
+        Keys are counted by a digest, the ledger does not store secrets
+    """
+    return hashlib.sha256(apikey.encode("utf-8")).hexdigest()[:16]
+
+
+def _period(window, now=None):
+    return time.strftime(WINDOW_FORMATS[window], time.gmtime(now or time.time()))
+
+
+class QuotaLedger:
+    """
+        Counts outbound calls per provider, key and window in the "quota_ledger"
+        collection, one document per window period updated with $inc
+    """
+
+    @staticmethod
+    def _apikey(provider):
+        return DB("apikeys").collection.find_one({"name": provider})
+
+    @staticmethod
+    def get_windows(provider, apikey_doc):
+        tier = apikey_doc.get("tier") if apikey_doc else None
+        tiers = QUOTAS[provider]
+        return tiers.get(tier, tiers[DEFAULT_TIER])
+
+    @staticmethod
+    def record(provider, apikey, calls=1):
+        if not provider in QUOTAS or not apikey:
+            return
+
+        try:
+            now = time.time()
+            expires_at = datetime.datetime.utcnow() + LEDGER_RETENTION
+            db = DB("quota_ledger")
+            for window in WINDOW_FORMATS:
+                period = _period(window, now)
+                db.collection.update_one(
+                    {"_id": f"{provider}:{_key_id(apikey)}:{period}"},
+                    {
+                        "$inc": {"calls": calls},
+                        "$setOnInsert": {
+                            "provider": provider,
+                            "window": window,
+                            "period": period,
+                            "expires_at": expires_at,
+                        },
+                    },
+                    upsert=True,
+                )
+
+        except Exception as e:
+            print(f"[QuotaLedger.record] {e}")
+            tb1 = traceback.TracebackException.from_exception(e)
+            print("".join(tb1.format()))
+
+    @staticmethod
+    def remaining(provider, priority=PRIORITY_HIGH):
+        """
+            Calls left for the current key in its most constrained window,
+            None when the provider has no quota or no key
+        """
+        if not provider in QUOTAS:
+            return None
+
+        apikey_doc = QuotaLedger._apikey(provider)
+        if not apikey_doc or not apikey_doc.get("apikey"):
+            return None
+
+        key_id = _key_id(apikey_doc["apikey"])
+        left = None
+        for window, limit in QuotaLedger.get_windows(provider, apikey_doc):
+            entry = DB("quota_ledger").collection.find_one(
+                {"_id": f"{provider}:{key_id}:{_period(window)}"}
+            )
+            calls = entry["calls"] if entry else 0
+            reserve = 0
+            if priority == PRIORITY_LOW:
+                reserve = int(limit * LOW_PRIORITY_RESERVE)
+            window_left = max(0, limit - reserve - calls)
+            left = window_left if left is None else min(left, window_left)
+
+        return left
+
+    @staticmethod
+    def is_exhausted(provider):
+        return QuotaLedger.remaining(provider) == 0
+
+    @staticmethod
+    def report():
+        """
+            Usage and remaining calls of every provider with a quota
+        """
+        report = []
+        for provider in QUOTAS:
+            apikey_doc = QuotaLedger._apikey(provider)
+            if not apikey_doc or not apikey_doc.get("apikey"):
+                report.append({"provider": provider, "apikey": False})
+                continue
+
+            key_id = _key_id(apikey_doc["apikey"])
+            windows = []
+            for window, limit in QuotaLedger.get_windows(provider, apikey_doc):
+                period = _period(window)
+                entry = DB("quota_ledger").collection.find_one(
+                    {"_id": f"{provider}:{key_id}:{period}"}
+                )
+                calls = entry["calls"] if entry else 0
+                windows.append(
+                    {
+                        "window": window,
+                        "period": period,
+                        "limit": limit,
+                        "calls": calls,
+                        "remaining": max(0, limit - calls),
+                    }
+                )
+
+            report.append(
+                {
+                    "provider": provider,
+                    "apikey": True,
+                    "tier": apikey_doc.get("tier", DEFAULT_TIER),
+                    "windows": windows,
+                }
+            )
+
+        return report
+
+
+class LaunchBudget:
+    """
+        Quota budget of a batch of launches. Remaining calls are read once per
+        provider and spent locally, so a bulk import cannot exceed them.
+    """
+
+    def __init__(self, priority=PRIORITY_LOW):
+        self.priority = priority
+        self.budgets = {}
+        self.dropped = {}
+
+    def take(self, plugin):
+        providers = [name for name in plugin.get("apikey_names", []) if name in QUOTAS]
+        if not providers:
+            return True
+
+        for provider in providers:
+            if not provider in self.budgets:
+                self.budgets[provider] = QuotaLedger.remaining(provider, self.priority)
+
+            if self.budgets[provider] == 0:
+                self.dropped[plugin["name"]] = self.dropped.get(plugin["name"], 0) + 1
+                return False
+
+        for provider in providers:
+            if self.budgets[provider] is not None:
+                self.budgets[provider] -= 1
+        return True
+
+    def give_back(self, plugin):
+        """
+            Return what take() spent for a launch which was not sent after all
+            (coalesced onto a running task, served from a fresh result...)
+        """
+        for name in plugin.get("apikey_names", []):
+            if self.budgets.get(name) is not None:
+                self.budgets[name] += 1
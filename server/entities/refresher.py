@@ -0,0 +1,172 @@
+import os
+import time
+import traceback
+
+from server.db import DB
+from server.entities.inflight import InFlight
+from server.entities.plugin_manager import PluginManager, FRESH_RESULT_STATUSES
+from server.entities.plugin_registry import PluginRegistry
+from server.entities.quota_ledger import LaunchBudget
+from server.entities.resource_manager import ResourceManager
+
+# Only resources of projects opened in this time are refreshed, in seconds
+ACTIVE_PROJECT_WINDOW = 14 * 86400
+
+# Plugin tasks in flight, whoever launched them, up to which a refresh run
+# launches work. A busy cluster gets no refresh work at all.
+REFRESH_CONCURRENCY = int(os.environ.get("THETHE_REFRESH_CONCURRENCY", 20))
+
+# Most launches of a single refresh run
+REFRESH_MAX_LAUNCHES = 50
+
+
+def _active_projects(now):
+    """
+        {resource_id: (project_id, last_open)} of the most recently opened
+        project holding every resource of an active project
+    """
+    projects = (
+        DB("projects")
+        .collection.find(
+            {"last_open": {"$gte": now - ACTIVE_PROJECT_WINDOW}},
+            {"resource_refs.resource_id": 1, "last_open": 1},
+        )
+        .sort([("last_open", -1)])
+    )
+
+    owners = {}
+    for project in projects:
+        for ref in project.get("resource_refs", []):
+            owners.setdefault(
+                ref["resource_id"], (str(project["_id"]), project["last_open"])
+            )
+    return owners
+
+
+def _is_refreshable(plugin, missing_apikeys):
+    if not plugin.get("freshness") or plugin.get("is_active"):
+        return False
+    if plugin.get("needs_apikey"):
+        return not any(name in missing_apikeys for name in plugin["apikey_names"])
+    return True
+
+
+class Refresher:
+    """
+        Relaunches plugins whose latest result for a resource is older than the
+        plugin freshness, for resources of recently opened projects. Only passive
+        plugins which already ran for the resource are refreshed.
+        Candidates are scored by staleness (age / freshness) weighted by project
+        activity (1 / (1 + days since last_open)), and launched as low priority
+        work: under REFRESH_CONCURRENCY and the quota reserve of LaunchBudget.
+    """
+
+    @staticmethod
+    def stale(now=None):
+        """
+            Stale (score, plugin_name, resource_id, project_id), best first
+        """
+        now = now or time.time()
+        owners = _active_projects(now)
+        if not owners:
+            return []
+
+        missing_apikeys = PluginRegistry.missing_apikeys()
+        # Only results has_fresh_result counts, failures do not make a result fresh
+        fresh_statuses = [
+            list(status.value) if isinstance(status.value, tuple) else status.value
+            for status in FRESH_RESULT_STATUSES
+        ]
+        candidates = []
+        for plugin in PluginRegistry.all():
+            if not _is_refreshable(plugin, missing_apikeys):
+                continue
+
+            freshness = plugin["freshness"]
+            latest_results = DB(plugin["name"]).collection.aggregate(
+                [
+                    {
+                        "$match": {
+                            "resource_id": {"$in": list(owners)},
+                            "result_status": {"$in": fresh_statuses},
+                        }
+                    },
+                    {
+                        "$group": {
+                            "_id": "$resource_id",
+                            "latest": {"$max": "$timestamp"},
+                        }
+                    },
+                    {"$match": {"latest": {"$lt": now - freshness}}},
+                ]
+            )
+            for latest in latest_results:
+                project_id, last_open = owners[latest["_id"]]
+                staleness = (now - latest["latest"]) / freshness
+                activity = 1 / (1 + (now - last_open) / 86400)
+                candidates.append(
+                    (staleness * activity, plugin["name"], latest["_id"], project_id)
+                )
+
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        return candidates
+
+    @staticmethod
+    def run():
+        """
+            Launch the stalest results, returns how many were launched
+        """
+        try:
+            in_flight = InFlight.count()
+            if in_flight is None:
+                print("[Refresher.run]: In-flight tasks unknown, skipping")
+                return 0
+
+            slots = min(REFRESH_CONCURRENCY - in_flight, REFRESH_MAX_LAUNCHES)
+            if slots <= 0:
+                print(f"[Refresher.run]: {in_flight} tasks in flight, skipping")
+                return 0
+
+            candidates = Refresher.stale()
+            budget = LaunchBudget()
+            launched = 0
+            # Resources are read a chunk of candidates at a time, launches which
+            # do not go out (coalesced, resource gone) leave room for the next ones
+            for index in range(0, len(candidates), REFRESH_MAX_LAUNCHES):
+                chunk = candidates[index : index + REFRESH_MAX_LAUNCHES]
+                resources = {
+                    resource.resource_id: resource
+                    for resource in ResourceManager.get_many(
+                        set(resource_id for _, _, resource_id, _ in chunk),
+                        projection=None,
+                    )
+                }
+
+                for score, plugin_name, resource_id, project_id in chunk:
+                    if launched == slots:
+                        break
+                    plugin = PluginManager.get_plugin_doc(plugin_name)
+                    if not budget.take(plugin):
+                        continue
+
+                    resource = resources.get(resource_id)
+                    manager = PluginManager(resource, project_id) if resource else None
+                    if manager and manager.launch(plugin_name):
+                        launched += 1
+                    else:
+                        # Not sent, it does not spend the quota
+                        budget.give_back(plugin)
+
+                if launched == slots:
+                    break
+
+            print(f"[Refresher.run]: Launched {launched}, {len(candidates)} were stale")
+            if budget.dropped:
+                print(f"[Refresher.run]: Dropped by quota {budget.dropped}")
+            return launched
+
+        except Exception as e:
+            print(f"[Refresher.run] {e}")
+            tb1 = traceback.TracebackException.from_exception(e)
+            print("".join(tb1.format()))
+            return 0
@@ -1,13 +1,15 @@
 import traceback
 import json
 import bson
+import bson.json_util
 import pymongo
+import pymongo.errors
 import time
 import urllib.parse
 import base64
 
 
-from server.db import DB
+from server.db import DB, LEGACY_COLLECTIONS, LegacyCollections
 from server.entities.plugin_manager import PluginManager
 from server.entities.plugin_result_types import PluginResultStatus
 from server.entities.update_central import UpdateCentral
@@ -25,13 +27,14 @@ def get_resource_legacy_method(resource_id):
         Returns resource and doc name to change global COLLECTION
     """
 
+    if LegacyCollections.are_empty():
+        return (None, None)
+
     print(
         f"[resource_base.get_resource_legacy_method]: Legacy method called looking for resource {resource_id}"
     )
 
-    docs = ["ip", "url", "username", "hash", "email", "domain"]
-
-    for doc in docs:
+    for doc in LEGACY_COLLECTIONS:
         collection = DB(doc).collection
         resource = collection.find_one({"_id": resource_id})
 
@@ -43,10 +46,36 @@ def get_resource_legacy_method(resource_id):
     return (None, None)
 
 
+# TODO: Get rid of this legacy method
+def get_resources_legacy_method(resource_ids, projection=None):
+    """
+        Batched version of get_resource_legacy_method.
+        Yields (resource, doc name) for every id found in old documents
+    """
+    if LegacyCollections.are_empty():
+        return
+
+    pending = list(resource_ids)
+
+    for doc in LEGACY_COLLECTIONS:
+        if not pending:
+            break
+
+        found = set()
+        for resource in DB(doc).collection.find({"_id": {"$in": pending}}, projection):
+            found.add(resource["_id"])
+            yield (resource, doc)
+
+        pending = [resource_id for resource_id in pending if resource_id not in found]
+
+
 # TODO: This is calling for trouble. We need to have a proper hierarchy to handle diferent ENTITIES
 def enrich_by_type(args):
     resource_type = ResourceType(args["resource_type"])
 
+    # Unique lookup key of the resource (together with its type)
+    args["searchable"] = args["canonical_name"]
+
     if resource_type == ResourceType.IPv4:
         args["address"] = args["canonical_name"]
 
@@ -66,6 +95,7 @@ def enrich_by_type(args):
 
     elif resource_type == ResourceType.HASH:
         args["hash"] = args["canonical_name"]
+        args["searchable"] = args["hash"]
         args["hash_type"] = HashType.hash_detection(args["hash"]).value
         # canonical_name == printable name in the view
         args["canonical_name"] = args["hash"][:8]
@@ -94,7 +124,7 @@ class Resource:
         return DB(collection).collection
 
     @staticmethod
-    def create(name, resource_type):
+    def new_document(name, resource_type):
         """
             name: name of the resource
             resource_type: type as ResourceType
@@ -106,11 +136,30 @@ class Resource:
             "tags": [],
         }
 
-        args = enrich_by_type(args)
+        return enrich_by_type(args)
+
+    @staticmethod
+    def create(name, resource_type):
+        """
+            name: name of the resource
+            resource_type: type as ResourceType
+        """
+        args = Resource.new_document(name, resource_type)
         result = Resource.collection().insert_one(args)
         print(f"Creating new resource with {args}")
         return Resource(str(result.inserted_id))
 
+    @staticmethod
+    def from_doc(doc, collection=COLLECTION):
+        """
+            Build a Resource from an already fetched document, without querying
+        """
+        resource = Resource.__new__(Resource)
+        resource.resource_id = bson.ObjectId(doc["_id"])
+        resource.resource = doc
+        resource.own_collection = collection
+        return resource
+
     def __init__(self, resource_id):
         self.resource_id = bson.ObjectId(resource_id)
         collection = COLLECTION
@@ -132,6 +181,22 @@ class Resource:
     def get_id_as_string(self):
         return str(self.resource_id)
 
+    def get_searchable(self):
+        """
+            Full value plugins must query for: the long hash for hashes,
+            canonical_name otherwise (older documents may lack "searchable")
+        """
+        return (
+            self.resource.get("searchable")
+            or self.resource.get("hash")
+            or self.resource["canonical_name"]
+        )
+
+    def get_field(self, field):
+        if field == "searchable":
+            return self.get_searchable()
+        return self.resource.get(field)
+
     def get_type(self):
         return ResourceType.get_type_from_string(self.resource["resource_type"])
 
@@ -143,15 +208,15 @@ class Resource:
 
     def launch_plugins(self, project_id, profile=None):
         try:
-            PluginManager(self, project_id).launch_all()
+            return PluginManager(self, project_id).launch_all()
 
         except Exception as e:
             tb1 = traceback.TracebackException.from_exception(e)
             print("".join(tb1.format()))
 
-    def launch_plugin(self, project_id, plugin_name, profile=None):
+    def launch_plugin(self, project_id, plugin_name, profile=None, force=False):
         try:
-            return PluginManager(self, project_id).launch(plugin_name)
+            return PluginManager(self, project_id).launch(plugin_name, force)
 
         except Exception as e:
             tb1 = traceback.TracebackException.from_exception(e)
@@ -212,78 +277,173 @@ class Resource:
             self.get_type_value()
         )
 
-        # Scan for results in all plugins resource type related
+        # Latest (or selected) result and timemachine of every plugin in one go
+        snapshots = _aggregate_plugin_snapshots(
+            plugins_names, self.resource_id, timestamp_index
+        )
+
+        for snapshot in snapshots:
+            result = _result_from_snapshot(snapshot)
+            if result:
+                doc["plugins"].append(result)
+
+        # If any plugin results is a list of external references (case pastebin), load them
+        _load_external_results(doc["plugins"])
+
+        return json.loads(json.dumps(doc, default=str))
+
+    @staticmethod
+    def get_plugin_snapshot(resource_id, plugin_name, timestamp_index=0):
+        """
+            Results of a single plugin at a given history index plus its timemachine.
+            Only the plugin collection is queried, the resource itself is not loaded.
+        """
+        snapshots = list(
+            DB(plugin_name).collection.aggregate(
+                _plugin_snapshot_pipeline(
+                    plugin_name, bson.ObjectId(resource_id), timestamp_index
+                )
+            )
+        )
+
+        result = _result_from_snapshot(snapshots[0]) if snapshots else None
+        if not result:
+            return None
+
+        _load_external_results([result])
+
+        return json.loads(json.dumps(result, default=str))
+
+
+def _plugin_snapshot_pipeline(plugin_name, resource_id, timestamp_index):
+    """
+        Aggregation stages resolving, for one plugin collection, the result at
+        "timestamp_index" (or the latest one) and the last timemachine entries
+    """
+    if timestamp_index < 0:
+        timestamp_index = 0
+
+    facets = {
+        "selected": [{"$skip": timestamp_index}, {"$limit": 1}],
+        "timemachine": [
+            {"$limit": LIMIT_OF_TIMEMACHINE_RESULTS},
+            {"$project": {"_id": 0, "timestamp": 1, "result_status": 1}},
+        ],
+    }
+
+    # Out of range indexes fall back to the latest result
+    if timestamp_index > 0:
+        facets["latest"] = [{"$limit": 1}]
+
+    return [
+        {"$match": {"resource_id": resource_id, "results": {"$exists": True}}},
+        {"$sort": {"timestamp": pymongo.DESCENDING}},
+        {"$facet": facets},
+        {"$addFields": {"name": plugin_name}},
+    ]
+
+
+def _aggregate_plugin_snapshots(plugins_names, resource_id, timestamp_index=0):
+    """
+        One aggregation over all plugin collections using $unionWith.
+        Servers older than MongoDB 4.4 fall back to one aggregation per plugin.
+    """
+    if not plugins_names:
+        return []
+
+    first, others = plugins_names[0], plugins_names[1:]
+    pipeline = _plugin_snapshot_pipeline(first, resource_id, timestamp_index)
+    for plugin_name in others:
+        pipeline.append(
+            {
+                "$unionWith": {
+                    "coll": plugin_name,
+                    "pipeline": _plugin_snapshot_pipeline(
+                        plugin_name, resource_id, timestamp_index
+                    ),
+                }
+            }
+        )
+
+    try:
+        return list(DB(first).collection.aggregate(pipeline))
+
+    except pymongo.errors.OperationFailure as e:
+        print(f"[resource_base._aggregate_plugin_snapshots]: No $unionWith support ({e})")
+        snapshots = []
         for plugin_name in plugins_names:
-            result_cursor = (
-                DB(plugin_name)
-                .collection.find(
-                    {"resource_id": self.resource_id, "results": {"$exists": True},}
+            snapshots.extend(
+                DB(plugin_name).collection.aggregate(
+                    _plugin_snapshot_pipeline(plugin_name, resource_id, timestamp_index)
                 )
-                .sort([("timestamp", pymongo.DESCENDING)])
             )
+        return snapshots
 
-            result_cursor = list(result_cursor)
-            if not len(result_cursor) == 0:
-                # Test timestamp index
-                if timestamp_index < 0 or timestamp_index > len(result_cursor) - 1:
-                    result = result_cursor[0]
-                else:
-                    result = result_cursor[timestamp_index]
-
-                # Add name of the plugin, because we do not store it in database
-                result["name"] = plugin_name
-
-                try:
-                    raw_result = result.get("results")
-                    if raw_result and type(raw_result) == bytes:
-                        # From bytes of a Binary object to a str
-                        raw_result = bson.json_util.dumps(raw_result)
-                        # From str to Python object
-                        raw_result = json.loads(raw_result)
-                        # Extract $binary. Now we have a binary string in raw_result.
-                        raw_result = raw_result["$binary"]
-                        # Content is a b64 string...
-                        result["results"] = raw_result
-                except Exception as e:
-                    tb1 = traceback.TracebackException.from_exception(e)
-                    print("".join(tb1.format()))
-
-                # If this plugin results is a list of external references (case pastebin), load it:
-                _load_external_results(result)
-
-                # Load all timemachine timestamps
-                timemachine = []
-
-                # Add the last LIMIT_OF_TIMEMACHINE_RESULTS timestamps to timemachine
-                for ts in result_cursor:
-                    timemachine.append(
-                        {
-                            "timestamp": ts["timestamp"],
-                            "result_status": ts["result_status"],
-                        }
-                    )
-
-                # Plug timemachine results in our plugin results
-                result["timemachine"] = timemachine
-
-                # Plug this plugin results to doc
-                doc["plugins"].append(result)
 
-        return json.loads(json.dumps(doc, default=str))
+def _result_from_snapshot(snapshot):
+    """
+        Build the plugin entry expected by the FE from an aggregated snapshot
+    """
+    selected = snapshot.get("selected") or snapshot.get("latest")
+    if not selected:
+        return None
 
-    # Get the complete document from a valid bson string reference
+    result = selected[0]
 
+    # Add name of the plugin, because we do not store it in database
+    result["name"] = snapshot["name"]
 
-def _load_external_results(plugin):
-    if "results" in plugin and isinstance(plugin["results"], list):
-        plugin["results"] = [
-            _get_doc_if_reference(plugin["name"], entry) for entry in plugin["results"]
-        ]
+    _decode_binary_results(result)
 
+    # Plug timemachine results in our plugin results
+    result["timemachine"] = snapshot["timemachine"]
+
+    return result
+
+
+def _decode_binary_results(result):
+    try:
+        raw_result = result.get("results")
+        if raw_result and type(raw_result) == bytes:
+            # From bytes of a Binary object to a str
+            raw_result = bson.json_util.dumps(raw_result)
+            # From str to Python object
+            raw_result = json.loads(raw_result)
+            # Extract $binary. Now we have a binary string in raw_result.
+            raw_result = raw_result["$binary"]
+            # Content is a b64 string...
+            result["results"] = raw_result
+    except Exception as e:
+        tb1 = traceback.TracebackException.from_exception(e)
+        print("".join(tb1.format()))
+
+
+def _load_external_results(plugins):
+    """
+        Resolve external references (ObjectIds stored in a results list) with one
+        query per external collection, "<plugin_name>s" by convention
+    """
+    references = {}
+    for plugin in plugins:
+        if "results" in plugin and isinstance(plugin["results"], list):
+            references.setdefault(plugin["name"], []).extend(
+                entry for entry in plugin["results"] if bson.ObjectId.is_valid(entry)
+            )
 
-def _get_doc_if_reference(plugin_name, entry):
-    if bson.ObjectId.is_valid(entry):
-        entry = DB(plugin_name + "s").collection.find_one(
-            {"_id": entry}, {"content": 0}
+    documents = {}
+    for plugin_name, entries in references.items():
+        if not entries:
+            continue
+        cursor = DB(plugin_name + "s").collection.find(
+            {"_id": {"$in": entries}}, {"content": 0}
         )
-    return entry
+        documents[plugin_name] = {doc["_id"]: doc for doc in cursor}
+
+    for plugin in plugins:
+        if plugin["name"] in documents:
+            plugin["results"] = [
+                documents[plugin["name"]].get(entry)
+                if bson.ObjectId.is_valid(entry)
+                else entry
+                for entry in plugin["results"]
+            ]
@@ -4,11 +4,16 @@ import validators
 import traceback
 
 from enum import Enum
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
-from server.db import DB
-from server.entities.resource_base import Resource
+from server.db import DB, LEGACY_COLLECTIONS, LegacyCollections
+from server.entities.resource_base import Resource, get_resources_legacy_method
 from server.entities.resource_types import ResourceType, ResourceTypeException
 
+# Fields needed to list resources in a project, plugin results are left out
+LIST_VIEW_PROJECTION = {"plugins": False}
+
 
 class ResourceManager:
     @staticmethod
@@ -19,6 +24,28 @@ class ResourceManager:
         """
         return Resource(resource_id)
 
+    @staticmethod
+    def get_many(resource_ids, projection=LIST_VIEW_PROJECTION):
+        """
+            Yield Resources for a list of ids with a single $in query, sorted by id.
+            Ids not found in "resources" are looked up in the legacy collections.
+        """
+        pending = set(resource_ids)
+
+        cursor = (
+            Resource.collection()
+            .find({"_id": {"$in": list(resource_ids)}}, projection)
+            .sort([("_id", 1)])
+        )
+        for doc in cursor:
+            pending.discard(doc["_id"])
+            yield Resource.from_doc(doc)
+
+        # TODO: Get rid of this legacy method
+        if pending:
+            for doc, collection in get_resources_legacy_method(pending, projection):
+                yield Resource.from_doc(doc, collection)
+
     # TODO: "resource_type" should not be needed here, all resources must have a "searchable" field.
     @staticmethod
     def get_by_name(resource_name, resource_type):
@@ -39,9 +66,8 @@ class ResourceManager:
 
         # TODO: Legacy method for old database resources
         # TODO: Get rid of this legacy method
-        if not result:
-            docs = ["ip", "url", "username", "hash", "email", "domain"]
-            for doc in docs:
+        if not result and not LegacyCollections.are_empty():
+            for doc in LEGACY_COLLECTIONS:
                 result = DB(doc).collection.find_one({search: resource_name})
                 if result:
                     return Resource(result["_id"])
@@ -64,12 +90,97 @@ class ResourceManager:
 
     @staticmethod
     def get_or_create(resource_name, resource_type):
-        created = False
-        resource = ResourceManager.get_by_name(resource_name, resource_type)
-        if not resource:
-            resource = Resource.create(resource_name, resource_type)
-            created = True
-        return (resource, created)
+        """
+            Atomic lookup-or-insert in one round trip, backed by the unique
+            (searchable, resource_type) index. Returns (resource, created)
+        """
+        resource_type = ResourceType.get_type_from_string(resource_type)
+
+        args = Resource.new_document(resource_name, resource_type)
+        # Our own _id tells us, and gives us, the document if it gets inserted
+        args["_id"] = bson.ObjectId()
+
+        query = {"searchable": args["searchable"], "resource_type": args["resource_type"]}
+
+        db = Resource.collection()
+        try:
+            previous = db.find_one_and_update(
+                query,
+                {"$setOnInsert": args},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE,
+            )
+        except DuplicateKeyError:
+            # A concurrent upsert inserted it first, so it exists now
+            previous = db.find_one(query)
+
+        if previous:
+            return (Resource.from_doc(previous), False)
+
+        print(f"Creating new resource with {args}")
+        return (Resource.from_doc(args), True)
+
+    @staticmethod
+    def bulk_get_or_create(entries):
+        """
+            entries: list of (resource_name, ResourceType)
+            Upsert all the entries with a single unordered bulk_write on the unique
+            (searchable, resource_type) key. Returns a list of (resource, created)
+        """
+        documents = []
+        keys = set()
+        for resource_name, resource_type in entries:
+            args = Resource.new_document(resource_name, resource_type)
+            key = (args["searchable"], args["resource_type"])
+            if key in keys:
+                continue
+            keys.add(key)
+            args["_id"] = bson.ObjectId()
+            documents.append(args)
+
+        if not documents:
+            return []
+
+        operations = [
+            UpdateOne(
+                {"searchable": args["searchable"], "resource_type": args["resource_type"]},
+                {"$setOnInsert": args},
+                upsert=True,
+            )
+            for args in documents
+        ]
+
+        db = Resource.collection()
+        try:
+            upserted = db.bulk_write(operations, ordered=False).upserted_ids
+
+        except BulkWriteError as e:
+            # Duplicated keys come from concurrent inserts of the same resources
+            if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                raise
+            upserted = {item["index"]: item["_id"] for item in e.details["upserted"]}
+
+        created_ids = set(upserted.values())
+
+        results = []
+        existing = {}
+        for args in documents:
+            if args["_id"] in created_ids:
+                results.append((Resource.from_doc(args), True))
+            else:
+                existing[(args["searchable"], args["resource_type"])] = args
+
+        if existing:
+            cursor = db.find(
+                {"searchable": {"$in": [key[0] for key in existing.keys()]}},
+                LIST_VIEW_PROJECTION,
+            )
+            for doc in cursor:
+                key = (doc.get("searchable"), doc.get("resource_type"))
+                if existing.pop(key, None):
+                    results.append((Resource.from_doc(doc), False))
+
+        return results
 
     @staticmethod
     def remove_tag(tag_id):
@@ -1,7 +1,5 @@
-import validators
 import re
 from enum import Enum
-from server.entities.hash_types import HashType
 
 
 class ResourceType(Enum):
@@ -27,37 +25,14 @@ class ResourceType(Enum):
 
     @classmethod
     def validate(cls, resource):
-        temp_username = f"{resource}@thethe.com"
+        # Compiled single pass classifier, see server/entities/ioc_classifier.py
+        from server.entities.ioc_classifier import classify
 
-        try:
-            if validators.ipv4(resource):
-                return ResourceType.IPv4
-
-            elif validators.domain(resource):
-                return ResourceType.DOMAIN
-
-            elif validators.url(resource):
-                return ResourceType.URL
-
-            elif validators.email(resource):
-                return ResourceType.EMAIL
-
-            elif (
-                HashType.hash_detection(resource) in HashType
-                and not HashType.hash_detection(resource) == HashType.UNKNOWN
-            ):
-                return ResourceType.HASH
-
-            # EYES HERE! We check a username as a contrived email
-            # See temp_username
-            elif validators.email(temp_username):
-                return ResourceType.USERNAME
-
-            print("[!] No resource type has found for your resource: {resource}")
-            return ResourceType.UNKNOWN
+        resource_type = classify(resource)
+        if resource_type == ResourceType.UNKNOWN:
+            print(f"[!] No resource type has found for your resource: {resource}")
 
-        except Exception as e:
-            raise Exception()
+        return resource_type
 
     @classmethod
     def validate_ip_or_domain(cls, resource):
@@ -31,6 +31,12 @@ class UpdateCentral:
         elif result_status == PluginResultStatus.JUST_UPDATED:
             message = f"Same result, just updating timestamp"
             status = "info"
+        elif result_status == PluginResultStatus.QUOTA_EXCEEDED:
+            message = f"API quota exhausted, not launched"
+            status = "error"
+        elif result_status == PluginResultStatus.TIMEOUT:
+            message = f"time limit reached, partial results stored"
+            status = "error"
 
         print(f"[UpdateCentral.set_pending_update]: {status} {message}")
 
@@ -0,0 +1,226 @@
+import traceback
+
+import pymongo
+
+from server.db import DB
+
+# Declarative list of the indexes thethe relies on.
+# Every entry is {"collection", "keys", "options"}; "keys" uses pymongo syntax.
+STATIC_INDEXES = [
+    # One resource per lookup key and type, enforced for get_or_create upserts
+    {
+        "collection": "resources",
+        "keys": [("searchable", pymongo.ASCENDING), ("resource_type", pymongo.ASCENDING)],
+        "options": {
+            "name": "searchable_1_resource_type_1",
+            "unique": True,
+            "partialFilterExpression": {"searchable": {"$exists": True}},
+        },
+    },
+    # Resource lookups by name (get_by_name) and by full hash
+    {
+        "collection": "resources",
+        "keys": [("canonical_name", pymongo.ASCENDING)],
+        "options": {"name": "canonical_name_1"},
+    },
+    {
+        "collection": "resources",
+        "keys": [("hash", pymongo.ASCENDING)],
+        "options": {"name": "hash_1", "sparse": True},
+    },
+    # Which projects hold a resource (search)
+    {
+        "collection": "projects",
+        "keys": [("resource_refs.resource_id", pymongo.ASCENDING)],
+        "options": {"name": "resource_refs.resource_id_1"},
+    },
+    {
+        "collection": "projects",
+        "keys": [("name", pymongo.ASCENDING)],
+        "options": {"name": "name_1"},
+    },
+    # Pending updates polled by /api/ping and purged by age
+    {
+        "collection": "update",
+        "keys": [("project_id", pymongo.ASCENDING), ("timestamp", pymongo.ASCENDING)],
+        "options": {"name": "project_id_1_timestamp_1"},
+    },
+    {
+        "collection": "update",
+        "keys": [("timestamp", pymongo.ASCENDING)],
+        "options": {"name": "timestamp_1"},
+    },
+    {
+        "collection": "users",
+        "keys": [("username", pymongo.ASCENDING)],
+        "options": {"name": "username_1"},
+    },
+    {
+        "collection": "apikeys",
+        "keys": [("name", pymongo.ASCENDING)],
+        "options": {"name": "name_1"},
+    },
+    {
+        "collection": "tags",
+        "keys": [("name", pymongo.ASCENDING)],
+        "options": {"name": "name_1"},
+    },
+    # Provider quota counters expire on their own
+    {
+        "collection": "quota_ledger",
+        "keys": [("expires_at", pymongo.ASCENDING)],
+        "options": {"name": "expires_at_1", "expireAfterSeconds": 0},
+    },
+    # Plugin runs of a resource, latest first, and stats of finished runs
+    {
+        "collection": "plugin_runs",
+        "keys": [("resource_id", pymongo.ASCENDING), ("enqueued_at", pymongo.DESCENDING)],
+        "options": {"name": "resource_id_1_enqueued_at_-1"},
+    },
+    {
+        "collection": "plugin_runs",
+        "keys": [("finished_at", pymongo.ASCENDING)],
+        "options": {"name": "finished_at_1", "sparse": True},
+    },
+    # Percentile picks of PluginRuns.stats, per plugin
+    {
+        "collection": "plugin_runs",
+        "keys": [("plugin", pymongo.ASCENDING), ("finished_at", pymongo.ASCENDING)],
+        "options": {"name": "plugin_1_finished_at_1"},
+    },
+    {
+        "collection": "plugin_runs",
+        "keys": [("expires_at", pymongo.ASCENDING)],
+        "options": {"name": "expires_at_1", "expireAfterSeconds": 0},
+    },
+    {
+        "collection": "pastebins",
+        "keys": [("paste_key", pymongo.ASCENDING)],
+        "options": {"name": "paste_key_1"},
+    },
+]
+
+
+def plugin_result_index(plugin_name):
+    """
+        Every plugin stores its results in its own collection, queried by
+        resource_id and sorted by timestamp (history, timemachine, diffs)
+    """
+    return {
+        "collection": plugin_name,
+        "keys": [("resource_id", pymongo.ASCENDING), ("timestamp", pymongo.DESCENDING)],
+        "options": {"name": "resource_id_1_timestamp_-1"},
+    }
+
+
+def get_index_manifest(plugin_names):
+    return STATIC_INDEXES + [plugin_result_index(name) for name in plugin_names]
+
+
+def _key_of(keys):
+    return tuple((field, direction) for field, direction in keys)
+
+
+def _existing_indexes(collection_name):
+    """
+        Returns {key_tuple: index_name} for a collection, ignoring _id
+    """
+    indexes = {}
+    for name, info in DB(collection_name).collection.index_information().items():
+        if name == "_id_":
+            continue
+        indexes[_key_of(info["key"])] = name
+    return indexes
+
+
+def _index_usage(collection_name):
+    """
+        Returns {index_name: ops} from $indexStats (counters reset on mongod restart)
+    """
+    try:
+        stats = DB(collection_name).collection.aggregate([{"$indexStats": {}}])
+        return {stat["name"]: stat["accesses"]["ops"] for stat in stats}
+    except Exception as e:
+        print(f"[indexes._index_usage] {collection_name}: {e}")
+        return {}
+
+
+def index_report(plugin_names):
+    """
+        Dry-run comparison between the manifest and the database.
+        Does not modify anything.
+            missing:    declared in the manifest, not present in database
+            undeclared: present in database, not in the manifest
+            unused:     present in database with no recorded accesses
+    """
+    manifest = get_index_manifest(plugin_names)
+    report = {"missing": [], "undeclared": [], "unused": []}
+
+    declared = {}
+    for spec in manifest:
+        declared.setdefault(spec["collection"], set()).add(_key_of(spec["keys"]))
+
+    for collection_name, declared_keys in declared.items():
+        existing = _existing_indexes(collection_name)
+
+        for keys in declared_keys:
+            if keys not in existing:
+                report["missing"].append(
+                    {"collection": collection_name, "keys": list(keys)}
+                )
+
+        usage = _index_usage(collection_name) if existing else {}
+        for keys, name in existing.items():
+            if keys not in declared_keys:
+                report["undeclared"].append(
+                    {"collection": collection_name, "name": name, "keys": list(keys)}
+                )
+            if usage.get(name) == 0:
+                report["unused"].append({"collection": collection_name, "name": name})
+
+    return report
+
+
+def ensure_indexes(plugin_names):
+    """
+        Create every missing index of the manifest, returns how many were created.
+        Raises if a unique index cannot be created: the data it should protect is
+        already inconsistent (e.g. duplicated resources) and lookups rely on it.
+    """
+    created = 0
+    failed_unique = []
+    for spec in get_index_manifest(plugin_names):
+        try:
+            existing = _existing_indexes(spec["collection"])
+            if _key_of(spec["keys"]) in existing:
+                continue
+
+            DB(spec["collection"]).collection.create_index(
+                spec["keys"], background=True, **spec["options"]
+            )
+            created += 1
+            print(
+                f"[indexes.ensure_indexes]: Created {spec['options']['name']} on {spec['collection']}"
+            )
+
+        except Exception as e:
+            print(f"[indexes.ensure_indexes] {spec['collection']}: {e}")
+            tb1 = traceback.TracebackException.from_exception(e)
+            print("".join(tb1.format()))
+            if spec["options"].get("unique"):
+                failed_unique.append(f"{spec['collection']}.{spec['options']['name']}")
+
+    if failed_unique:
+        raise RuntimeError(
+            f"[indexes.ensure_indexes] Unique indexes not created: {', '.join(failed_unique)}"
+        )
+
+    return created
+
+
+def print_index_report(report):
+    for kind in ["missing", "undeclared", "unused"]:
+        entries = report[kind]
+        print(f"[thethe_server]: {len(entries)} {kind} indexes")
+        for entry in entries:
+            print(f"    {kind}: {entry}")
@@ -36,7 +36,9 @@ app.register_blueprint(tags_api)
 app.register_blueprint(apikeys_api)
 app.register_blueprint(search_api)
 
-cors = CORS(app, resources={r"/api/*": {"origins": "*"}})
+cors = CORS(
+    app, resources={r"/api/*": {"origins": "*"}}, expose_headers=["X-Next-Cursor"]
+)
 api_app = Api(app)
 
 if __name__ == "__main__":
@@ -65,10 +65,37 @@ PLUGIN_DESCRIPTION = "Lists all the people working in a company with their name
 #     If True, the plugin neither will be loaded nor will be shown in thethe.
 #  PLUGIN_NEEDS_API_KEY = True
 #     If True, the plugin needs an APIKEY to work, False otherwise
+#  PLUGIN_TASK = "main"
+#     Name of the celery task (decorated function below) thethe launches for this plugin
+#  PLUGIN_TASK_TARGET = {"target": "searchable"}
+#     Which task argument receives the resource and from which resource field.
+#     "searchable" is the full value of the resource (the long form for hashes),
+#     other fields are the ones in the resource document ("domain", "address", "hash"...)
+#  PLUGIN_QUEUE = "slow_io"
+#     Celery queue class the task runs in, so long scans do not delay quick lookups.
+#     "fast" (sub-second lookups), "slow_io" (third party APIs), "long_polling"
+#     (waiting on a remote job) or "cpu" (long scans, local processing). See tasks/queues.py
+#     "async_io" is for async plugins (tasks/async_engine.py): an event loop worker keeps
+#     hundreds of their provider calls in flight.
+#  PLUGIN_FRESHNESS = 21600
+#     Seconds a stored result is considered fresh. Launching the plugin again inside
+#     this window does not call the provider unless a refresh is forced. 0 disables it.
+#  PLUGIN_TIME_LIMIT = 600
+#     Optional soft time limit of the task, in seconds, the queue one when missing.
+#     On it SoftTimeLimitExceeded is raised in the task so it can store partial results
+#     with PluginResultStatus.TIMEOUT, 30 seconds later the worker kills it.
+#
+#  All these constants, RESOURCE_TARGET, API_KEY_DOC and API_KEY_NAMES are read
+#  without importing the plugin (see server/entities/plugin_manifest.py), so they
+#  must be plain literals, not computed values.
 PLUGIN_IS_ACTIVE = False
 PLUGIN_AUTOSTART = False
 PLUGIN_DISABLE = False
 PLUGIN_NEEDS_API_KEY = True
+PLUGIN_TASK = "main"
+PLUGIN_TASK_TARGET = {"target": "searchable"}
+PLUGIN_QUEUE = "slow_io"
+PLUGIN_FRESHNESS = 21600  # 6 hours
 
 # <------- /PLUGIN CONFIGURATION ------->
 
@@ -1,11 +1,12 @@
 import traceback
 import json
-import requests
 
 from tasks.api_keys import KeyRing
 from server.entities.plugin_manager import PluginManager
 from server.entities.resource_types import ResourceType
 from tasks.tasks import celery_app
+from tasks.http_client import http
+from tasks.rate_limiter import rate_limit
 from server.entities.plugin_result_types import PluginResultStatus
 from server.entities.plugin_manager import PluginManager
 
@@ -21,6 +22,10 @@ PLUGIN_DISABLE = False
 PLUGIN_IS_ACTIVE = False
 PLUGIN_NAME = "abuseipdb"
 PLUGIN_NEEDS_API_KEY = True
+PLUGIN_TASK = "abuseipdb"
+PLUGIN_TASK_TARGET = {"ip": "searchable"}
+PLUGIN_QUEUE = "slow_io"
+PLUGIN_FRESHNESS = 21600  # 6 hours
 
 API_KEY = KeyRing().get("abuseipdb")
 API_KEY_IN_DDBB = bool(API_KEY)
@@ -51,8 +56,10 @@ class Plugin:
             print("".join(tb1.format()))
 
 
-@celery_app.task
-def abuseipdb(ip, plugin_name, project_id, resource_id, resource_type):
+@celery_app.task(bind=True)
+def abuseipdb(self, ip, plugin_name, project_id, resource_id, resource_type):
+    rate_limit(self, "abuseipdb")
+
     try:
         result_status = PluginResultStatus.STARTED
         API_KEY = KeyRing().get("abuseipdb")
@@ -64,7 +71,7 @@ def abuseipdb(ip, plugin_name, project_id, resource_id, resource_type):
         else:
             headers = {"Accept": "application/json", "Key": API_KEY}
             data = {"ipAddress": ip}
-            abuse_response = requests.get(URL, headers=headers, json=data)
+            abuse_response = http("abuseipdb").get(URL, headers=headers, json=data)
 
             if not abuse_response.status_code == 200:
                 print("[abuseipdb]: Return non 200 code")
@@ -21,6 +21,10 @@ PLUGIN_DISABLE = False
 PLUGIN_IS_ACTIVE = False
 PLUGIN_NAME = "basic"
 PLUGIN_NEEDS_API_KEY = False
+PLUGIN_TASK = "basic_ip"
+PLUGIN_TASK_TARGET = {"ip": "address"}
+PLUGIN_QUEUE = "fast"
+PLUGIN_FRESHNESS = 86400  # 24 hours
 
 API_KEY = False
 API_KEY_IN_DDBB = False
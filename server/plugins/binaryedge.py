@@ -25,6 +25,10 @@ PLUGIN_DISABLE = True
 PLUGIN_IS_ACTIVE = False
 PLUGIN_NAME = "binaryedge"
 PLUGIN_NEEDS_API_KEY = True
+PLUGIN_TASK = "binaryedge"
+PLUGIN_TASK_TARGET = {"ip": "address"}
+PLUGIN_QUEUE = "slow_io"
+PLUGIN_FRESHNESS = 21600  # 6 hours
 
 # 250 requests left, 31 days until renewal.
 API_KEY = KeyRing().get("binaryedge")
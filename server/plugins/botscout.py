@@ -35,6 +35,10 @@ PLUGIN_DISABLE = True
 PLUGIN_IS_ACTIVE = False
 PLUGIN_NAME = "botscout"
 PLUGIN_NEEDS_API_KEY = True
+PLUGIN_TASK = "botscout_task"
+PLUGIN_TASK_TARGET = {"ip": "address"}
+PLUGIN_QUEUE = "slow_io"
+PLUGIN_FRESHNESS = 21600  # 6 hours
 
 API_KEY = KeyRing().get("botscout")
 API_KEY_IN_DDBB = bool(API_KEY)
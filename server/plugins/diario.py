@@ -9,6 +9,7 @@ from server.entities.resource_types import ResourceType
 from server.entities.plugin_result_types import PluginResultStatus
 from tasks.api_keys import KeyRing
 from tasks.tasks import celery_app
+from tasks.fan_out import fan_out
 
 __PREDICTION = {"M": "Malware", "G": "Goodware", "NM": "No macros"}
 __STATUS = {"A": "Analyzed", "P": "Processing", "F": "Failed"}
@@ -23,6 +24,10 @@ PLUGIN_DISABLE = False
 PLUGIN_IS_ACTIVE = False
 PLUGIN_NAME = "diario"
 PLUGIN_NEEDS_API_KEY = True
+PLUGIN_TASK = "diario"
+PLUGIN_TASK_TARGET = {"document_hash": "hash"}
+PLUGIN_QUEUE = "slow_io"
+PLUGIN_FRESHNESS = 86400  # 24 hours
 
 APP_ID = KeyRing().get("diario-appid")
 SECRET_KEY = KeyRing().get("diario-secret")
@@ -118,22 +123,21 @@ def _get_subdocument(diariosdk, data, document_type):
 
 
 def get_subdocument(diariosdk, data, document_type):
-    sub_documents = []
     if document_type == "pdf":
         sub_document_type = "javaScripts"
+        get_info = diariosdk.get_javascript_info
     else:
         sub_document_type = "macros"
+        get_info = diariosdk.get_macro_info
 
-    for sub_document in data.get(sub_document_type):
-        if document_type == "pdf":
-            sd_response = diariosdk.get_javascript_info(sub_document)
-        else:
-            sd_response = diariosdk.get_macro_info(sub_document)
-
-        if sd_response and sd_response.data:
-            sub_documents.append(sd_response.data)
+    # Sub-documents are fetched at once, in the order of the document
+    sd_responses = fan_out(get_info, data.get(sub_document_type) or [])
 
-    return sub_documents
+    return [
+        sd_response.data
+        for sd_response in sd_responses
+        if sd_response and sd_response.data
+    ]
 
 
 def old_get_result(diariosdk, data):
@@ -9,11 +9,12 @@ Github: https://github.com/santiagorocha
 Twitter: https://twitter.com/sarvmetal
 Linkedin: https://www.linkedin.com/in/santiago-rocha-62b38762/
 """
-import requests
 import json
 import traceback
 
 from tasks.tasks import celery_app
+from tasks.http_client import http
+from tasks.fan_out import fan_out
 from server.entities.resource_types import ResourceType
 from server.entities.plugin_result_types import PluginResultStatus
 from server.entities.plugin_manager import PluginManager
@@ -37,6 +38,10 @@ PLUGIN_IS_ACTIVE = False
 PLUGIN_AUTOSTART = False
 PLUGIN_DISABLE = False
 PLUGIN_NEEDS_API_KEY = True
+PLUGIN_TASK = "dinoflux"
+PLUGIN_TASK_TARGET = {"target": "searchable"}
+PLUGIN_QUEUE = "slow_io"
+PLUGIN_FRESHNESS = 21600  # 6 hours
 
 RESOURCE_TARGET = [
     ResourceType.HASH,
@@ -142,12 +147,11 @@ def get_report(resource_type, target):
     if dinoflux_res:
         dinoflux_json = json.loads(dinoflux_res.content)
         total_reports = dinoflux_json.get("total")
+        analyses = dinoflux_json.get("analyses")
+        for analysis in analyses:
+            reports.append(get_clean_report(analysis))
         if total_reports > 10:
-            reports = get_reports(total_reports, query)
-        else:
-            analyses = dinoflux_json.get("analyses")
-            for analysis in analyses:
-                reports.append(get_clean_report(analysis))
+            reports.extend(get_reports(total_reports, query))
 
         all_reports["analyses"] = reports
 
@@ -166,7 +170,7 @@ page if there are less or even 10 reports available for a single IOC
 def send_query(query, page=1):
     params = {"key": API_KEY, "query": query, "page": page}
 
-    dinoflux_res = requests.get(URL_API, params=params)
+    dinoflux_res = http("dinoflux").get(URL_API, params=params)
 
     if dinoflux_res.status_code != 200:
         return None
@@ -176,9 +180,10 @@ def send_query(query, page=1):
 
 """
 This function is in charge of determine the quantity of pages to request, make
-the request, save them all in a list and return them. If any of the requests
-to the dinoflux API fails, it will stop and return the collected information until
-the moment of fail.
+the requests of the pages after the first one (already read by get_report) at
+once, save them all in a list and return them. If any of the requests to the
+dinoflux API fails, it will return the information collected from the pages
+before the failed one.
 """
 
 
@@ -186,19 +191,17 @@ def get_reports(total_reports, query):
     reports = []
 
     if total_reports % 10 == 0:
-        pages = total_reports / 10
+        pages = total_reports // 10
     else:
         pages = total_reports // 10 + 1
 
-    current_page = 1
-    while current_page <= pages:
-        dinoflux_res = send_query(query, current_page)
+    responses = fan_out(lambda page: send_query(query, page), range(2, pages + 1))
+    for dinoflux_res in responses:
         if dinoflux_res:
             dinoflux_json = json.loads(dinoflux_res.content)
             analyses = dinoflux_json.get("analyses")
             for analysis in analyses:
                 reports.append(get_clean_report(analysis))
-            current_page += 1
         else:
             break
 
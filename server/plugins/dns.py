@@ -22,6 +22,10 @@ PLUGIN_DISABLE = False
 PLUGIN_IS_ACTIVE = False
 PLUGIN_NAME = "dns"
 PLUGIN_NEEDS_API_KEY = False
+PLUGIN_TASK = "dns"
+PLUGIN_TASK_TARGET = {"domain": "domain"}
+PLUGIN_QUEUE = "fast"
+PLUGIN_FRESHNESS = 3600  # 1 hour
 
 API_KEY = False
 API_KEY_IN_DDBB = False
@@ -1,9 +1,10 @@
 import traceback
 import json
-import requests
 
 from tasks.api_keys import KeyRing
 from tasks.tasks import celery_app
+from tasks.http_client import http
+from tasks.rate_limiter import rate_limit
 from server.entities.plugin_manager import PluginManager
 from server.entities.resource_types import ResourceType
 from server.entities.plugin_result_types import PluginResultStatus
@@ -22,6 +23,10 @@ PLUGIN_DISABLE = False
 PLUGIN_IS_ACTIVE = False
 PLUGIN_NAME = "emailrep"
 PLUGIN_NEEDS_API_KEY = False
+PLUGIN_TASK = "emailrep"
+PLUGIN_TASK_TARGET = {"email": "searchable"}
+PLUGIN_QUEUE = "slow_io"
+PLUGIN_FRESHNESS = 86400  # 24 hours
 
 API_KEY = KeyRing().get("emailrep")
 API_KEY_IN_DDBB = bool(API_KEY)
@@ -52,8 +57,10 @@ class Plugin:
             print("".join(tb1.format()))
 
 
-@celery_app.task
-def emailrep(plugin_name, project_id, resource_id, resource_type, email):
+@celery_app.task(bind=True)
+def emailrep(self, plugin_name, project_id, resource_id, resource_type, email):
+    rate_limit(self, "emailrep")
+
     try:
         # API Key is not needed bynow 20-01-2020
         # if not API_KEY:
@@ -64,7 +71,7 @@ def emailrep(plugin_name, project_id, resource_id, resource_type, email):
         result_status = PluginResultStatus.STARTED
 
         headers = {"Accept": "application/json"}
-        emailrep_response = requests.get(
+        emailrep_response = http("emailrep").get(
             URL.format(**{"email": email}), json={}, headers=headers
         )
         if not emailrep_response.status_code == 200:
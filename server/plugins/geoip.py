@@ -6,6 +6,7 @@ import urllib.request
 from tasks.api_keys import KeyRing
 from server.entities.resource_types import ResourceType
 from tasks.tasks import celery_app
+from server.entities.quota_ledger import QuotaLedger
 from server.entities.plugin_manager import PluginManager
 from server.entities.plugin_result_types import PluginResultStatus
 
@@ -20,6 +21,10 @@ PLUGIN_DISABLE = False
 PLUGIN_IS_ACTIVE = False
 PLUGIN_NAME = "geoip"
 PLUGIN_NEEDS_API_KEY = True
+PLUGIN_TASK = "geoip"
+PLUGIN_TASK_TARGET = {"ip": "address"}
+PLUGIN_QUEUE = "fast"
+PLUGIN_FRESHNESS = 604800  # 7 days
 
 API_KEY = KeyRing().get("ipstack")
 API_KEY_IN_DDBB = bool(API_KEY)
@@ -61,22 +66,39 @@ def geoip(plugin_name, project_id, resource_id, resource_type, ip):
             print("No API key...!")
             return None
 
+        if QuotaLedger.is_exhausted("ipstack"):
+            print("[geoip]: Quota exhausted")
+            PluginManager.set_plugin_results(
+                resource_id,
+                plugin_name,
+                project_id,
+                result,
+                PluginResultStatus.QUOTA_EXCEEDED,
+            )
+            return None
+
         URL = f"http://api.ipstack.com/{ip}?access_key={API_KEY}&format=1"
+        QuotaLedger.record("ipstack", API_KEY)
         response = urllib.request.urlopen(URL).read()
 
         result = json.loads(response)
-        if "success" in result:
-            if not result["success"]:
-                if result["error"]["code"] in [101, 102, 103, 104, 105]:
-                    result_status = PluginResultStatus.NO_API_KEY
-                elif result["error"]["code"] == 404:
-                    result_status = PluginResultStatus.RETURN_NONE
+        if not result.get("success", True):
+            # 104: monthly usage limit reached, not a key problem
+            if result["error"]["code"] == 104:
+                result_status = PluginResultStatus.QUOTA_EXCEEDED
+            elif result["error"]["code"] in [101, 102, 103, 105]:
+                result_status = PluginResultStatus.NO_API_KEY
+            elif result["error"]["code"] == 404:
+                result_status = PluginResultStatus.RETURN_NONE
+            else:
+                result_status = PluginResultStatus.FAILED
         else:
             result_status = PluginResultStatus.COMPLETED
 
-            PluginManager.set_plugin_results(
-                resource_id, plugin_name, project_id, result, result_status
-            )
+        # Errors are stored too, so a spent quota is told apart from a bad key
+        PluginManager.set_plugin_results(
+            resource_id, plugin_name, project_id, result, result_status
+        )
 
     except Exception as e:
         tb1 = traceback.TracebackException.from_exception(e)
@@ -3,10 +3,11 @@ import traceback
 from server.entities.resource_types import ResourceType
 from server.entities.plugin_manager import PluginManager
 from tasks.tasks import celery_app
+from tasks.http_client import http
+from tasks.rate_limiter import rate_limit
 from server.entities.plugin_result_types import PluginResultStatus
 
 import json
-import requests
 
 from tasks.api_keys import KeyRing
 
@@ -23,6 +24,10 @@ PLUGIN_DISABLE = False
 PLUGIN_IS_ACTIVE = False
 PLUGIN_NAME = "haveibeenpwned"
 PLUGIN_NEEDS_API_KEY = True
+PLUGIN_TASK = "haveibeenpwned"
+PLUGIN_TASK_TARGET = {"email": "searchable"}
+PLUGIN_QUEUE = "slow_io"
+PLUGIN_FRESHNESS = 86400  # 24 hours
 
 API_KEY = KeyRing().get("haveibeenpwned")
 API_KEY_IN_DDBB = bool(API_KEY)
@@ -68,8 +73,10 @@ def breach_detail_filler(sites):
     return [entry for entry in blob if entry["Name"] in sites]
 
 
-@celery_app.task
-def haveibeenpwned(plugin_name, project_id, resource_id, resource_type, email):
+@celery_app.task(bind=True)
+def haveibeenpwned(self, plugin_name, project_id, resource_id, resource_type, email):
+    rate_limit(self, "haveibeenpwned")
+
     try:
         API_KEY = KeyRing().get("haveibeenpwned")
         if not API_KEY:
@@ -82,7 +89,7 @@ def haveibeenpwned(plugin_name, project_id, resource_id, resource_type, email):
                 "user-agent": "Mozilla/5.0 (Windows NT 6.1; WOW64; rv:64.0) Gecko/20100101 Firefox/64.0",
                 "hibp-api-key": API_KEY,
             }
-            hibp = requests.get(
+            hibp = http("haveibeenpwned").get(
                 URL.format(**{"service": "breachedaccount", "account": email}),
                 headers=headers,
             )
@@ -6,6 +6,7 @@ from tasks.api_keys import KeyRing
 from server.entities.plugin_manager import PluginManager
 from server.entities.resource_types import ResourceType
 from tasks.tasks import celery_app
+from server.entities.quota_ledger import QuotaLedger
 from server.entities.plugin_result_types import PluginResultStatus
 
 
@@ -26,6 +27,10 @@ PLUGIN_DISABLE = False
 PLUGIN_IS_ACTIVE = False
 PLUGIN_NAME = "hunterio"
 PLUGIN_NEEDS_API_KEY = True
+PLUGIN_TASK = "hunterio"
+PLUGIN_TASK_TARGET = {"target": "searchable"}
+PLUGIN_QUEUE = "slow_io"
+PLUGIN_FRESHNESS = 604800  # 7 days
 
 API_KEY = KeyRing().get("hunterio")
 API_KEY_IN_DDBB = bool(API_KEY)
@@ -92,8 +97,15 @@ def hunterio(plugin_name, project_id, resource_id, resource_type, target):
         if not API_KEY:
             print("No API key...!")
             result_status = PluginResultStatus.NO_API_KEY
+        elif QuotaLedger.is_exhausted("hunterio"):
+            print("[hunterio]: Quota exhausted")
+            result_status = PluginResultStatus.QUOTA_EXCEEDED
+            PluginManager.set_plugin_results(
+                resource_id, plugin_name, project_id, query_result, result_status
+            )
         else:
             result_status = PluginResultStatus.STARTED
+            QuotaLedger.record("hunterio", API_KEY)
 
             resource_type = ResourceType(resource_type)
             if resource_type == ResourceType.DOMAIN:
@@ -32,6 +32,10 @@ PLUGIN_DISABLE = False
 PLUGIN_IS_ACTIVE = False
 PLUGIN_NAME = "maltiverse"
 PLUGIN_NEEDS_API_KEY = True
+PLUGIN_TASK = "maltiverse"
+PLUGIN_TASK_TARGET = {"target": "searchable"}
+PLUGIN_QUEUE = "slow_io"
+PLUGIN_FRESHNESS = 21600  # 6 hours
 
 MALTIVERSE_EMAIL = KeyRing().get("maltiverse_email")
 MALTIVERSE_PASS = KeyRing().get("maltiverse_pass")
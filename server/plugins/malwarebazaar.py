@@ -21,6 +21,10 @@ PLUGIN_DISABLE = False
 PLUGIN_IS_ACTIVE = False
 PLUGIN_NAME = "malwarebazaar"
 PLUGIN_NEEDS_API_KEY = False
+PLUGIN_TASK = "malwarebazaar_task"
+PLUGIN_TASK_TARGET = {"target": "searchable"}
+PLUGIN_QUEUE = "slow_io"
+PLUGIN_FRESHNESS = 21600  # 6 hours
 
 API_KEY = False
 API_KEY_IN_DDBB = False
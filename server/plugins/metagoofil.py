@@ -2,6 +2,8 @@ import os
 import traceback
 from urllib.parse import urlparse
 
+from celery.exceptions import SoftTimeLimitExceeded
+
 import tasks.deps.metagoofil.metagoofil as _metagoofil
 
 from server.entities.plugin_manager import PluginManager
@@ -21,6 +23,11 @@ PLUGIN_DISABLE = False
 PLUGIN_IS_ACTIVE = False
 PLUGIN_NAME = "metagoofil"
 PLUGIN_NEEDS_API_KEY = False
+PLUGIN_TASK = "metagoofil"
+PLUGIN_TASK_TARGET = {"domain": "searchable"}
+PLUGIN_QUEUE = "cpu"
+PLUGIN_FRESHNESS = 86400  # 24 hours
+PLUGIN_TIME_LIMIT = 600  # 10 minutes
 
 API_KEY = False
 API_KEY_IN_DDBB = bool(API_KEY)
@@ -68,6 +75,14 @@ def metagoofil(domain, plugin_name, project_id, resource_id, resource_type):
             resource_id, plugin_name, project_id, response, result_status
         )
 
+    except SoftTimeLimitExceeded:
+        # Files found before the time limit
+        search = getattr(_metagoofil, "mg", None)
+        response = list(getattr(search, "all_files", []))
+        PluginManager.set_plugin_results(
+            resource_id, plugin_name, project_id, response, PluginResultStatus.TIMEOUT
+        )
+
     except Exception as e:
         tb1 = traceback.TracebackException.from_exception(e)
         print("".join(tb1.format()))
@@ -22,6 +22,10 @@ PLUGIN_IS_ACTIVE = False
 PLUGIN_DISABLE = False
 PLUGIN_NAME = "onyphe"
 PLUGIN_NEEDS_API_KEY = True
+PLUGIN_TASK = "onyphe"
+PLUGIN_TASK_TARGET = {"resource": "searchable"}
+PLUGIN_QUEUE = "slow_io"
+PLUGIN_FRESHNESS = 21600  # 6 hours
 
 API_KEY = KeyRing().get("onyphe")
 API_KEY_IN_DDBB = bool(API_KEY)
@@ -4,7 +4,7 @@
 
 import traceback
 import json
-import requests, base64
+import base64
 
 from server.entities.resource_manager import ResourceManager
 from server.entities.plugin_result_types import PluginResultStatus
@@ -25,6 +25,7 @@ URL_IPv6 = "https://otx.alienvault.com/api/v1/indicators/IPv6/{ip}/{section}"
 from server.entities.plugin_manager import PluginManager
 from server.entities.resource_types import ResourceType
 from tasks.tasks import celery_app
+from tasks.http_client import http
 
 
 # Which resources are this plugin able to work with
@@ -42,6 +43,10 @@ PLUGIN_DISABLE = True
 PLUGIN_IS_ACTIVE = False
 PLUGIN_NAME = "otx"
 PLUGIN_NEEDS_API_KEY = True
+PLUGIN_TASK = "otx_task"
+PLUGIN_TASK_TARGET = {"target": "searchable"}
+PLUGIN_QUEUE = "slow_io"
+PLUGIN_FRESHNESS = 21600  # 6 hours
 
 API_KEY = KeyRing().get("otx")
 API_KEY_IN_DDBB = bool(API_KEY)
@@ -86,7 +91,7 @@ def otx_iocs_file(file_hash, section):
             "X-OTX-API-KEY": API_KEY,
         }
         print("testessss ")
-        response = requests.get(
+        response = http("otx").get(
             URL_HASH.format(**{"file_hash": file_hash, "section": section}),
             headers=headers,
         )
@@ -117,7 +122,7 @@ def otx_iocs_url(url, section):
             "User-Agent": "Mozilla/5.0 (X11; Linux i686; rv:64.0) Gecko/20100101 Firefox/64.0",
             "X-OTX-API-KEY": API_KEY,
         }
-        response = requests.get(
+        response = http("otx").get(
             URL_URL.format(**{"url": url, "section": section}), headers=headers
         )
         if not response.status_code == 200:
@@ -147,7 +152,7 @@ def otx_iocs_hostname(hostname, section):
             "User-Agent": "Mozilla/5.0 (X11; Linux i686; rv:64.0) Gecko/20100101 Firefox/64.0",
             "X-OTX-API-KEY": API_KEY,
         }
-        response = requests.get(
+        response = http("otx").get(
             URL_URL.format(**{"hostname": hostname, "section": section}),
             headers=headers,
         )
@@ -178,7 +183,7 @@ def otx_iocs_ipv4(ip, section):
             "User-Agent": "Mozilla/5.0 (X11; Linux i686; rv:64.0) Gecko/20100101 Firefox/64.0",
             "X-OTX-API-KEY": API_KEY,
         }
-        response = requests.get(
+        response = http("otx").get(
             URL_IPv4.format(**{"ip": ip, "section": section}), headers=headers
         )
         if not response.status_code == 200:
@@ -208,7 +213,7 @@ def otx_iocs_ipv6(ip, section):
             "User-Agent": "Mozilla/5.0 (X11; Linux i686; rv:64.0) Gecko/20100101 Firefox/64.0",
             "X-OTX-API-KEY": API_KEY,
         }
-        response = requests.get(
+        response = http("otx").get(
             URL_IPv6.format(**{"ip": ip, "section": section}), headers=headers
         )
         if not response.status_code == 200:
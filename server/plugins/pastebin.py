@@ -1,7 +1,7 @@
 import json
 import traceback
 import pprint
-import time
+import bson
 import requests
 
 from server.db import DB
@@ -13,6 +13,7 @@ from server.entities.plugin_result_types import PluginResultStatus
 from tasks.api_keys import KeyRing
 from tasks.googlesearch import restricted_googlesearch
 from tasks.tasks import celery_app
+from tasks.rate_limiter import RateLimiter, defer
 
 
 # Which resources are this plugin able to work with
@@ -32,6 +33,10 @@ PLUGIN_DISABLE = False
 PLUGIN_IS_ACTIVE = False
 PLUGIN_NAME = "pastebin"
 PLUGIN_NEEDS_API_KEY = True
+PLUGIN_TASK = "pastebin"
+PLUGIN_TASK_TARGET = {"target": "searchable"}
+PLUGIN_QUEUE = "long_polling"
+PLUGIN_FRESHNESS = 86400  # 24 hours
 
 API_KEY = KeyRing().get("pastebin")
 API_KEY_IN_DDBB = bool(API_KEY)
@@ -42,9 +47,7 @@ API_KEY_NAMES = ["pastebin"]
 # This is the engine for pastebin, other sites should be created in control panel (GMAIL ACCOUNT REQUIRED)
 SEARCH_ENGINE = "002161999705497793957:w2bsgwyai92"
 
-# pastebin.com says 1 second between queries, so be cautious and lets it be 1.1 seconds
-# https://pastebin.com/doc_scraping_api#5
-RATE_LIMIT = 1.1
+# pastebin.com rate limit is configured in tasks/rate_limiter.py
 
 METADATA_URL = "https://scrape.pastebin.com/api_scrape_item_meta.php?i="
 RAWPASTE_URL = "https://scrape.pastebin.com/api_scrape_item.php?i="
@@ -80,10 +83,24 @@ class Plugin:
             print("".join(tb1.format()))
 
 
-@celery_app.task
+@celery_app.task(bind=True)
 def pastebin(
-    plugin_name, project_id, resource_id, resource_type, target, search_engine
+    self,
+    plugin_name,
+    project_id,
+    resource_id,
+    resource_type,
+    target,
+    search_engine=SEARCH_ENGINE,
+    search_results=None,
+    pastebins_refs=None,
+    next_link=0,
 ):
+    """
+        search_results, pastebins_refs and next_link carry the progress of a task
+        deferred by the rate limiter, so pastes already fetched are not fetched again
+    """
+    wait = 0
     try:
         query_result = None
         API_KEY = KeyRing().get("pastebin")
@@ -93,15 +110,38 @@ def pastebin(
         else:
             # We use "googlesearch" subtask to gather results as pastebin.com does not
             # have a in-search engine
-            query_result = restricted_googlesearch(search_engine, target)
+            if search_results is None:
+                search_results = restricted_googlesearch(search_engine, target)
 
             # Now, process google results and get the pastes and metadata
-            if query_result:
-                query_result = pastebin_get_results(query_result)
+            if search_results:
+                pastebins_refs, next_link, wait = pastebin_get_results(
+                    search_results, pastebins_refs or [], next_link
+                )
+                query_result = [bson.ObjectId(ref) for ref in pastebins_refs] or None
                 result_status = PluginResultStatus.COMPLETED
             else:
                 result_status = PluginResultStatus.RETURN_NONE
 
+    except Exception as e:
+        tb1 = traceback.TracebackException.from_exception(e)
+        print("".join(tb1.format()))
+        return
+
+    # Out of the try block, defer raises to reschedule the task
+    if wait:
+        defer(
+            self,
+            wait,
+            kwargs={
+                **self.request.kwargs,
+                "search_results": search_results,
+                "pastebins_refs": pastebins_refs,
+                "next_link": next_link,
+            },
+        )
+
+    try:
         PluginManager.set_plugin_results(
             resource_id, plugin_name, project_id, query_result, result_status
         )
@@ -115,66 +155,67 @@ def get_key_from_paste_key(item):
     return item.split("/")[-1]
 
 
-def pastebin_get_results(results):
-    try:
-        API_KEY = KeyRing().get("pastebin")
-        if not API_KEY:
-            raise Exception("No API_KEY for pastebin")
-
-        links = []
-        if "items" in results:
-            links = [item["link"] for item in results["items"]]
-        pastebins_refs = []
-
-        for link in links:
-            paste_key = get_key_from_paste_key(link)
-            try:
-                time.sleep(RATE_LIMIT)
-
-                args = {}
-                meta = requests.get(METADATA_URL + paste_key)
-                if meta.status_code == 200:
-                    try:
-                        meta = meta.json()[0]
-                    except:
-                        print(f"This paste {paste_key} has been deleted")
-                        continue
-                else:
-                    print(f"Error {meta.status_code} getting paste from pastebin.com")
-                    continue
+def pastebin_get_results(results, pastebins_refs, next_link=0):
+    """
+        Fetch the metadata and content of the pastes in the google results,
+        starting at next_link. Stops when the pastebin.com budget is exhausted.
+        Returns (pastebins_refs as strings, next link to fetch, seconds to wait)
+        Seconds to wait is 0 when every link has been processed.
+    """
+    API_KEY = KeyRing().get("pastebin")
+    if not API_KEY:
+        raise Exception("No API_KEY for pastebin")
 
-                for field in [
-                    "size",
-                    "title",
-                    "user",
-                    "hits",
-                    "date",
-                    "syntax",
-                    "expire",
-                ]:
-                    args[field] = meta[field]
+    links = []
+    if "items" in results:
+        links = [item["link"] for item in results["items"]]
 
-                paste = Paste(paste_key, args)
+    for index in range(next_link, len(links)):
+        link = links[index]
+        paste_key = get_key_from_paste_key(link)
 
-                time.sleep(RATE_LIMIT)
+        # Two queries per paste: metadata and raw content
+        wait = RateLimiter.acquire("pastebin", tokens=2)
+        if wait:
+            return (pastebins_refs, index, wait)
 
-                result = requests.get(RAWPASTE_URL + paste_key)
+        try:
+            args = {}
+            meta = requests.get(METADATA_URL + paste_key)
+            if meta.status_code == 200:
+                try:
+                    meta = meta.json()[0]
+                except:
+                    print(f"This paste {paste_key} has been deleted")
+                    continue
+            else:
+                print(f"Error {meta.status_code} getting paste from pastebin.com")
+                continue
 
-                if result.status_code == 200:
-                    paste.set_content(result.content)
+            for field in [
+                "size",
+                "title",
+                "user",
+                "hits",
+                "date",
+                "syntax",
+                "expire",
+            ]:
+                args[field] = meta[field]
 
-                pastebins_refs.append(paste.save())
+            paste = Paste(paste_key, args)
 
-            except Exception as e:
-                print(f"Failed to get pastebin: {link}")
-                tb1 = traceback.TracebackException.from_exception(e)
-                print("".join(tb1.format()))
-                continue
+            result = requests.get(RAWPASTE_URL + paste_key)
 
-        if len(pastebins_refs) == 0 or len(links) == 0:
-            return None
-        return pastebins_refs
+            if result.status_code == 200:
+                paste.set_content(result.content)
 
-    except Exception as e:
-        tb1 = traceback.TracebackException.from_exception(e)
-        print("".join(tb1.format()))
+            pastebins_refs.append(str(paste.save()))
+
+        except Exception as e:
+            print(f"Failed to get pastebin: {link}")
+            tb1 = traceback.TracebackException.from_exception(e)
+            print("".join(tb1.format()))
+            continue
+
+    return (pastebins_refs, len(links), 0)
@@ -28,6 +28,10 @@ PLUGIN_DISABLE = False
 PLUGIN_IS_ACTIVE = False
 PLUGIN_NAME = "phishtank"
 PLUGIN_NEEDS_API_KEY = True
+PLUGIN_TASK = "phishtank"
+PLUGIN_TASK_TARGET = {"url": "searchable"}
+PLUGIN_QUEUE = "slow_io"
+PLUGIN_FRESHNESS = 21600  # 6 hours
 
 API_KEY = KeyRing().get("phishtank")
 API_KEY_IN_DDBB = bool(API_KEY)
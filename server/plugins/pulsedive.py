@@ -20,6 +20,10 @@ PLUGIN_DISABLE = True
 PLUGIN_IS_ACTIVE = False
 PLUGIN_NAME = "pulsedive"
 PLUGIN_NEEDS_API_KEY = True
+PLUGIN_TASK = "pulsedive_task"
+PLUGIN_TASK_TARGET = {"domain_or_hash": "searchable"}
+PLUGIN_QUEUE = "slow_io"
+PLUGIN_FRESHNESS = 21600  # 6 hours
 
 API_KEY = KeyRing().get("pulsedive")
 API_KEY_IN_DDBB = bool(API_KEY)
@@ -1,10 +1,10 @@
 import traceback
 import json
-import requests
 
 from server.entities.plugin_manager import PluginManager
 from server.entities.resource_types import ResourceType
 from tasks.tasks import celery_app
+from tasks.http_client import http
 from server.entities.plugin_result_types import PluginResultStatus
 
 
@@ -18,6 +18,10 @@ PLUGIN_DISABLE = False
 PLUGIN_IS_ACTIVE = False
 PLUGIN_NAME = "robtex"
 PLUGIN_NEEDS_API_KEY = False
+PLUGIN_TASK = "robtex"
+PLUGIN_TASK_TARGET = {"ip": "searchable"}
+PLUGIN_QUEUE = "slow_io"
+PLUGIN_FRESHNESS = 21600  # 6 hours
 
 URL = "https://freeapi.robtex.com/ipquery/{ip}"
 
@@ -57,7 +61,7 @@ def robtex(plugin_name, project_id, resource_id, resource_type, ip):
     result_status = PluginResultStatus.STARTED
 
     try:
-        robtex_response = requests.get(URL.format(**{"ip": ip}))
+        robtex_response = http("robtex").get(URL.format(**{"ip": ip}))
         if not robtex_response.status_code == 200:
             print("Robtext error!")
             result_status = PluginResultStatus.FAILED
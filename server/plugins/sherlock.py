@@ -3,6 +3,8 @@ import os
 import json
 
 
+from celery.exceptions import SoftTimeLimitExceeded
+
 import tasks.deps.sherlock.sherlock.sherlock as _sherlock
 from tasks.deps.sherlock.sherlock.notify import QueryNotifyPrint
 
@@ -18,6 +20,11 @@ RESOURCE_TARGET = [ResourceType.USERNAME]
 # Plugin Metadata {a description, if target is actively reached and name}
 PLUGIN_DESCRIPTION = "Use Sherlock to find usernames across many social networks"
 PLUGIN_NEEDS_API_KEY = False
+PLUGIN_TASK = "sherlock"
+PLUGIN_TASK_TARGET = {"username": "searchable"}
+PLUGIN_QUEUE = "cpu"
+PLUGIN_FRESHNESS = 86400  # 24 hours
+PLUGIN_TIME_LIMIT = 600  # 10 minutes
 PLUGIN_IS_ACTIVE = False
 PLUGIN_NAME = "sherlock"
 PLUGIN_AUTOSTART = False
@@ -28,6 +35,9 @@ API_KEY_IN_DDBB = False
 API_KEY_DOC = ""
 API_KEY_NAMES = []
 
+# Seconds to wait for every site
+SITE_TIMEOUT = 20
+
 
 class Plugin:
     description = PLUGIN_DESCRIPTION
@@ -60,11 +70,34 @@ class Plugin:
             print("".join(tb1.format()))
 
 
+class QueryNotifyCollect(QueryNotifyPrint):
+    """
+        Keeps the sites already checked, they are stored if the time limit is hit
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.results = []
+
+    def update(self, result):
+        self.results.append(result)
+        return super().update(result)
+
+
+def site_result(site, url_user, status):
+    return {
+        "sitename": site,
+        "url_user": url_user,
+        "exists": "yes" if str(status) == "Claimed" else "no",
+    }
+
+
 @celery_app.task
 def sherlock(username, plugin_name, project_id, resource_id, resource_type):
 
     response = []
     result_status = PluginResultStatus.STARTED
+    query_notify = QueryNotifyCollect()
 
     try:
         site_data_all = None
@@ -93,19 +126,12 @@ def sherlock(username, plugin_name, project_id, resource_id, resource_type):
                 except:
                     print("Invalid JSON loaded from file.")
 
-        result = _sherlock.sherlock(username, site_data_all, QueryNotifyPrint(),)
+        result = _sherlock.sherlock(
+            username, site_data_all, query_notify, timeout=SITE_TIMEOUT
+        )
 
         for site, result in result.items():
-
-            temp_result = {}
-
-            temp_result["sitename"] = site
-            temp_result["url_user"] = result.get("url_user")
-            temp_result["exists"] = (
-                "yes" if str(result["status"]) == "Claimed" else "no"
-            )
-
-            response.append(temp_result)
+            response.append(site_result(site, result.get("url_user"), result["status"]))
 
         if response:
             result_status = PluginResultStatus.COMPLETED
@@ -116,6 +142,15 @@ def sherlock(username, plugin_name, project_id, resource_id, resource_type):
             resource_id, plugin_name, project_id, response, result_status
         )
 
+    except SoftTimeLimitExceeded:
+        response = [
+            site_result(result.site_name, result.site_url_user, result.status)
+            for result in query_notify.results
+        ]
+        PluginManager.set_plugin_results(
+            resource_id, plugin_name, project_id, response, PluginResultStatus.TIMEOUT
+        )
+
     except Exception as e:
         tb1 = traceback.TracebackException.from_exception(e)
         print("".join(tb1.format()))
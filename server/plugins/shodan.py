@@ -1,12 +1,14 @@
 import traceback
 import json
-import requests
 
 from tasks.api_keys import KeyRing
 from server.entities.plugin_manager import PluginManager
 from server.entities.resource_types import ResourceType
 from server.entities.plugin_result_types import PluginResultStatus
 from tasks.tasks import celery_app
+from tasks.http_client import http
+from tasks.rate_limiter import rate_limit
+from server.entities.quota_ledger import QuotaLedger
 
 # Which resources are this plugin able to work with
 RESOURCE_TARGET = [ResourceType.IPv4]
@@ -18,6 +20,10 @@ PLUGIN_DISABLE = False
 PLUGIN_IS_ACTIVE = False
 PLUGIN_NAME = "shodan"
 PLUGIN_NEEDS_API_KEY = True
+PLUGIN_TASK = "shodan"
+PLUGIN_TASK_TARGET = {"ip": "searchable"}
+PLUGIN_QUEUE = "slow_io"
+PLUGIN_FRESHNESS = 21600  # 6 hours
 
 API_KEY = KeyRing().get("shodan")
 API_KEY_IN_DDBB = bool(API_KEY)
@@ -50,8 +56,10 @@ class Plugin:
             print("".join(tb1.format()))
 
 
-@celery_app.task
-def shodan(plugin_name, project_id, resource_id, resource_type, ip):
+@celery_app.task(bind=True)
+def shodan(self, plugin_name, project_id, resource_id, resource_type, ip):
+    rate_limit(self, "shodan")
+
     result_status = PluginResultStatus.STARTED
     response = {}
 
@@ -61,8 +69,13 @@ def shodan(plugin_name, project_id, resource_id, resource_type, ip):
             print("No API key...!")
             result_status = PluginResultStatus.NO_API_KEY
 
+        elif QuotaLedger.is_exhausted("shodan"):
+            print("[shodan]: Quota exhausted")
+            result_status = PluginResultStatus.QUOTA_EXCEEDED
+
         else:
-            ipinfo = requests.get(URL.format(**{"ip": ip, "API_KEY": API_KEY}))
+            QuotaLedger.record("shodan", API_KEY)
+            ipinfo = http("shodan").get(URL.format(**{"ip": ip, "API_KEY": API_KEY}))
 
             if not ipinfo.status_code == 200:
                 result_status = PluginResultStatus.RETURN_NONE
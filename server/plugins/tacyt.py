@@ -18,6 +18,10 @@ PLUGIN_IS_ACTIVE = False
 PLUGIN_NAME = "tacyt"
 PLUGIN_DISABLE = False
 PLUGIN_NEEDS_API_KEY = True
+PLUGIN_TASK = "tacyt"
+PLUGIN_TASK_TARGET = {"apk_hash": "hash"}
+PLUGIN_QUEUE = "slow_io"
+PLUGIN_FRESHNESS = 86400  # 24 hours
 
 APP_ID = KeyRing().get("tacyt-appid")
 SECRET_KEY = KeyRing().get("tacyt-secret")
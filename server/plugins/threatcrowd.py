@@ -1,9 +1,8 @@
 import traceback
 import json
-import requests
 
 from server.entities.resource_types import ResourceType
-from tasks.tasks import celery_app
+from tasks.async_engine import async_task, run_sync
 from server.entities.plugin_manager import PluginManager
 from server.entities.plugin_result_types import PluginResultStatus
 
@@ -28,6 +27,10 @@ PLUGIN_DISABLE = False
 PLUGIN_IS_ACTIVE = False
 PLUGIN_NAME = "threatcrowd"
 PLUGIN_NEEDS_API_KEY = False
+PLUGIN_TASK = "threatcrowd"
+PLUGIN_TASK_TARGET = {"target": "searchable"}
+PLUGIN_QUEUE = "async_io"
+PLUGIN_FRESHNESS = 21600  # 6 hours
 
 API_KEY = False
 API_KEY_IN_DDBB = False
@@ -64,16 +67,16 @@ class Plugin:
             print("".join(tb1.format()))
 
 
-def send_request(url):
+async def send_request(session, url):
     try:
         response = {}
-        threatcrowd_response = requests.get(url)
-        if not threatcrowd_response.status_code == 200:
-            print("Response error!")
-            return None
-        else:
-            response = json.loads(threatcrowd_response.content)
-            print(response)
+        async with session.get(url) as threatcrowd_response:
+            if not threatcrowd_response.status == 200:
+                print("Response error!")
+                return None
+            else:
+                response = json.loads(await threatcrowd_response.read())
+                print(response)
         return response
 
     except Exception as e:
@@ -82,41 +85,26 @@ def send_request(url):
         return None
 
 
-def threatcrowd_ip(ip):
-    url = URL_IP.format(ip)
-    return send_request(url)
-
-
-def threatcrowd_domain(domain):
-    url = URL_DOMAIN.format(domain)
-    return send_request(url)
-
-
-def threatcrowd_email(email):
-    url = URL_EMAIL.format(email)
-    return send_request(url)
-
-
-def threatcrowd_hash(hash):
-    url = URL_HASH.format(hash)
-    return send_request(url)
+URLS = {
+    ResourceType.IPv4: URL_IP,
+    ResourceType.DOMAIN: URL_DOMAIN,
+    ResourceType.EMAIL: URL_EMAIL,
+    ResourceType.HASH: URL_HASH,
+}
 
 
-@celery_app.task
-def threatcrowd(plugin_name, project_id, resource_id, resource_type, target):
+@async_task
+async def threatcrowd(
+    session, plugin_name, project_id, resource_id, resource_type, target
+):
     result_status = PluginResultStatus.STARTED
     query_result = {}
 
     try:
         resource_type = ResourceType(resource_type)
-        if resource_type == ResourceType.IPv4:
-            query_result = threatcrowd_ip(target)
-        elif resource_type == ResourceType.DOMAIN:
-            query_result = threatcrowd_domain(target)
-        elif resource_type == ResourceType.EMAIL:
-            query_result = threatcrowd_email(target)
-        elif resource_type == ResourceType.HASH:
-            query_result = threatcrowd_hash(target)
+        if resource_type in URLS:
+            url = URLS[resource_type].format(target)
+            query_result = await send_request(session, url)
         else:
             print("ThreatCrowd resource type does not found")
             result_status = PluginResultStatus.FAILED
@@ -128,8 +116,13 @@ def threatcrowd(plugin_name, project_id, resource_id, resource_type, target):
             print(query_result)
             result_status = PluginResultStatus.COMPLETED
 
-        PluginManager.set_plugin_results(
-            resource_id, plugin_name, project_id, query_result, result_status
+        await run_sync(
+            PluginManager.set_plugin_results,
+            resource_id,
+            plugin_name,
+            project_id,
+            query_result,
+            result_status,
         )
 
     except Exception as e:
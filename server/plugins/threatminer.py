@@ -7,8 +7,9 @@ from server.entities.resource_manager import ResourceManager
 from server.entities.plugin_result_types import PluginResultStatus
 
 from tasks.tasks import celery_app
-import json
-import requests
+from tasks.http_client import http
+from tasks.fan_out import fan_out
+from tasks.rate_limiter import rate_limit
 
 
 # Which resources are this plugin able to work with
@@ -21,6 +22,10 @@ PLUGIN_DISABLE = False
 PLUGIN_IS_ACTIVE = False
 PLUGIN_NAME = "threatminer"
 PLUGIN_NEEDS_API_KEY = False
+PLUGIN_TASK = "threatminer_task"
+PLUGIN_TASK_TARGET = {"target": "searchable"}
+PLUGIN_QUEUE = "slow_io"
+PLUGIN_FRESHNESS = 21600  # 6 hours
 
 # IMPORTANT NOTE: Please note that the rate limit is set to 10 queries per minute.
 API_KEY = False
@@ -28,6 +33,42 @@ API_KEY_IN_DDBB = False
 API_KEY_DOC = ""
 API_KEY_NAMES = []
 
+DOMAIN_URL = "https://api.threatminer.org/v2/domain.php?q={target}&rt={tab_rt}"
+HOST_URL = "https://api.threatminer.org/v2/host.php?q={target}&rt={tab_rt}"
+SAMPLE_URL = "https://api.threatminer.org/v2/sample.php?q={target}&rt={tab_rt}"
+
+# Tabs (rt parameter) of every endpoint and the result field they are stored in
+DOMAIN_TABS = {
+    1: "whois",
+    2: "passivedns",
+    3: "queryuri",
+    4: "samples",
+    5: "subdomains",
+    6: "reporttag",
+}
+HOST_TABS = {
+    1: "whois",
+    2: "passivedns",
+    3: "queryuri",
+    4: "samples",
+    5: "sslcerts",
+    6: "reporttag",
+}
+SAMPLE_TABS = {
+    1: "metadata",
+    2: "httptraffic",
+    3: "hosts",
+    4: "mutants",
+    5: "regkeys",
+    6: "avdetect",
+    7: "reporttag",
+}
+TABS = {
+    ResourceType.DOMAIN: DOMAIN_TABS,
+    ResourceType.IPv4: HOST_TABS,
+    ResourceType.HASH: SAMPLE_TABS,
+}
+
 
 class Plugin:
     def __init__(self, resource, project_id):
@@ -60,7 +101,7 @@ def threatminer_searchAPTNotes(fulltext):
     try:
         URL = "https://api.threatminer.org/v2/reports.php?q={fulltext}&rt=1"
         response = {}
-        response = requests.get(URL.format(**{"fulltext": fulltext}))
+        response = http("threatminer").get(URL.format(**{"fulltext": fulltext}))
         if not response.status_code == 200:
             print("API key error!")
             return None
@@ -82,7 +123,7 @@ def threatminer_APTNotesToIoCs(filename_param, year):
         )
         response = {}
 
-        response = requests.get(
+        response = http("threatminer").get(
             URL.format(**{"filename_param": filename_param, "year": year})
         )
         if not response.status_code == 200:
@@ -104,7 +145,7 @@ def threatminer_AVDetection(name_virus):
         URL = "	https://api.threatminer.org/v2/av.php?q={name_virus}&rt=1"
         response = {}
 
-        response = requests.get(URL.format(**{"name_virus": name_virus}))
+        response = http("threatminer").get(URL.format(**{"name_virus": name_virus}))
         if not response.status_code == 200:
             print("API key error!")
             return None
@@ -124,7 +165,9 @@ def threatminer_ssl(hash, tab_rt):
         URL = "https://api.threatminer.org/v2/ssl.php?q={hash}&rt={tab_rt}"
         response = {}
 
-        response = requests.get(URL.format(**{"hash": hash, "tab_rt": tab_rt}))
+        response = http("threatminer").get(
+            URL.format(**{"hash": hash, "tab_rt": tab_rt})
+        )
         if not response.status_code == 200:
             print("API key error!")
             return None
@@ -139,138 +182,51 @@ def threatminer_ssl(hash, tab_rt):
         return None
 
 
-def threatminer_samples(hash):
-    try:
-        response_data = {}
-
-        for tab_rt in range(1, 8):
-            URL = "https://api.threatminer.org/v2/sample.php?q="+hash+"&rt="+str(tab_rt)+""
-            print(URL)
-
-            response = requests.get(URL)
-            if not response.status_code == 200:
-                print("API key error!")
-                return None
-            else:
-                response_data["type_query"] = "hash"
-                if tab_rt == 1:
-                    response_data["metadata"] = json.loads(response.content)
-                    print(response_data["metadata"])
-                elif tab_rt == 2:
-                    response_data["httptraffic"] = json.loads(response.content)
-                    print(response_data["httptraffic"])
-                elif tab_rt == 3:
-                    response_data["hosts"] = json.loads(response.content)
-                    print(response_data["hosts"])
-                elif tab_rt == 4:
-                    response_data["mutants"] = json.loads(response.content)
-                    print(response_data["mutants"])
-                elif tab_rt == 5:
-                    response_data["regkeys"] = json.loads(response.content)
-                    print(response_data["regkeys"])
-                elif tab_rt == 6:
-                    response_data["avdetect"] = json.loads(response.content)
-                    print(response_data["avdetect"])
-                elif tab_rt == 7:
-                    response_data["reporttag"] = json.loads(response.content)
-                    print(response_data["reporttag"])
-
-        return response_data
+def threatminer_tabs(url, target, tabs, type_query):
+    """
+        Query every tab (rt parameter) of a ThreatMiner endpoint at once
+    """
 
-    except Exception as e:
-        tb1 = traceback.TracebackException.from_exception(e)
-        print("".join(tb1.format()))
+    def get_tab(tab_rt):
+        response = http("threatminer").get(url.format(target=target, tab_rt=tab_rt))
+        if not response.status_code == 200:
+            print("API key error!")
+            return None
+        return json.loads(response.content)
+
+    results = fan_out(get_tab, tabs)
+    if any(result is None for result in results):
         return None
 
+    response_data = {"type_query": type_query}
+    for tab_rt, result in zip(tabs, results):
+        response_data[tabs[tab_rt]] = result
 
-def threatminer_ip(ip):
-    try:
-        response_data = {}
-
-        for tab_rt in range(1, 7):
-            URL = "https://api.threatminer.org/v2/host.php?q="+ip+"&rt="+str(tab_rt)+""
-            print(URL)
-
-            response = requests.get(URL)
-            if not response.status_code == 200:
-                print("API key error!")
-                return None
-            else:
-                response_data["type_query"] = "ip"
-                if tab_rt == 1:
-                    response_data["whois"] = json.loads(response.content)
-                    print(response_data["whois"])
-                elif tab_rt == 2:
-                    response_data["passivedns"] = json.loads(response.content)
-                    print(response_data["passivedns"])
-                elif tab_rt == 3:
-                    response_data["queryuri"] = json.loads(response.content)
-                    print(response_data["queryuri"])
-                elif tab_rt == 4:
-                    response_data["samples"] = json.loads(response.content)
-                    print(response_data["samples"])
-                elif tab_rt == 5:
-                    response_data["sslcerts"] = json.loads(response.content)
-                    print(response_data["sslcerts"])
-                elif tab_rt == 6:
-                    response_data["reporttag"] = json.loads(response.content)
-                    print(response_data["reporttag"])
-
-        return response_data
+    return response_data
 
-    except Exception as e:
-        tb1 = traceback.TracebackException.from_exception(e)
-        print("".join(tb1.format()))
-        return None
 
+def threatminer_samples(hash):
+    return threatminer_tabs(SAMPLE_URL, hash, SAMPLE_TABS, "hash")
 
-def threatminer_domain(domain):
-    try:
-        response_data = {}
-
-        for tab_rt in range(1, 7):
-            URL = "https://api.threatminer.org/v2/domain.php?q="+domain+"&rt="+str(tab_rt)+""
-            #print(URL)
-
-            response = requests.get(URL)
-            #print(response.content)
-            if not response.status_code == 200:
-                print("API key error!")
-                return None
-            else:
-                response_data["type_query"] = "domain"
-                if tab_rt == 1:
-                    response_data["whois"] = json.loads(response.content)
-                    #print(response_data["whois"])
-                elif tab_rt == 2:
-                    response_data["passivedns"] = json.loads(response.content)
-                    #print(response_data["passivedns"])
-                elif tab_rt == 3:
-                    response_data["queryuri"] = json.loads(response.content)
-                    #print(response_data["queryuri"])
-                elif tab_rt == 4:
-                    response_data["samples"] = json.loads(response.content)
-                    #print(response_data["samples"])
-                elif tab_rt == 5:
-                    response_data["subdomains"] = json.loads(response.content)
-                    #print(response_data["subdomains"])
-                elif tab_rt == 6:
-                    response_data["reporttag"] = json.loads(response.content)
-                    #print(response_data["reporttag"])
-
-        return response_data
 
-    except Exception as e:
-        tb1 = traceback.TracebackException.from_exception(e)
-        print("".join(tb1.format()))
-        return None
+def threatminer_ip(ip):
+    return threatminer_tabs(HOST_URL, ip, HOST_TABS, "ip")
 
 
-@celery_app.task
-def threatminer_task(plugin_name, project_id, resource_id, resource_type, target):
+def threatminer_domain(domain):
+    return threatminer_tabs(DOMAIN_URL, domain, DOMAIN_TABS, "domain")
+
+
+@celery_app.task(bind=True)
+def threatminer_task(self, plugin_name, project_id, resource_id, resource_type, target):
 
     resource_type_miner = ResourceType(resource_type)
 
+    # Every tab is a query, reserve them all before fanning out
+    tabs = TABS.get(resource_type_miner)
+    if tabs:
+        rate_limit(self, "threatminer", tokens=len(tabs))
+
     try:
         query_result = {}
         result_status = PluginResultStatus.STARTED
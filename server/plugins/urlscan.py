@@ -1,13 +1,14 @@
 import traceback
 import json
-import time
-import requests
 import base64
 from urllib.parse import urlparse
 
 
+from server.entities.inflight import InFlight, HANDED_OFF
 from server.entities.resource_types import ResourceType
 from tasks.tasks import celery_app
+from tasks.http_client import http
+from tasks.rate_limiter import defer
 from tasks.api_keys import KeyRing
 from server.entities.plugin_manager import PluginManager
 from server.entities.plugin_result_types import PluginResultStatus
@@ -23,6 +24,10 @@ PLUGIN_IS_ACTIVE = False
 PLUGIN_DISABLE = False
 PLUGIN_NAME = "urlscan"
 PLUGIN_NEEDS_API_KEY = True
+PLUGIN_TASK = "urlscan"
+PLUGIN_TASK_TARGET = {"url": "searchable"}
+PLUGIN_QUEUE = "long_polling"
+PLUGIN_FRESHNESS = 86400  # 24 hours
 
 API_KEY = KeyRing().get("urlscan")
 API_KEY_IN_DDBB = bool(API_KEY)
@@ -35,6 +40,13 @@ RESULT_URL = "https://urlscan.io/api/v1/result/{uuid}/"
 SCREENSHOTS_STORAGE_PATH = "/temp/urlscan/"
 SCREENSHOTS_SERVER_PATH = "static/urlscan/"
 
+# Scans take 10 seconds at least, then the result is polled with exponential
+# backoff until POLL_LIMIT seconds have been waited, in seconds
+POLL_FIRST_DELAY = 10
+POLL_BACKOFF = 2
+POLL_MAX_DELAY = 60
+POLL_LIMIT = 300
+
 
 class Plugin:
     def __init__(self, resource, project_id):
@@ -60,17 +72,17 @@ class Plugin:
 
 
 def result(uuid):
-    url_result_response = requests.get(RESULT_URL.format(**{"uuid": uuid}))
+    url_result_response = http("urlscan").get(RESULT_URL.format(**{"uuid": uuid}))
     if not url_result_response.status_code == 200:
         print("URL Result API error for uuid {}".format(uuid))
         return None
     return json.loads(url_result_response.content)
 
 
-def urlscan_screenshot(url):
+def download_screenshot(url):
     try:
         screenshot_name = urlparse(url).path.split("/")[-1]
-        r = requests.get(url, allow_redirects=True)
+        r = http("urlscan").get(url, allow_redirects=True)
         with open(f"{SCREENSHOTS_STORAGE_PATH}{screenshot_name}", "wb") as f:
             f.write(r.content)
         return f"{SCREENSHOTS_SERVER_PATH}{screenshot_name}"
@@ -81,8 +93,34 @@ def urlscan_screenshot(url):
         return None
 
 
-@celery_app.task
-def urlscan(plugin_name, project_id, resource_id, resource_type, url):
+def poll_delay(attempt):
+    return min(POLL_FIRST_DELAY * POLL_BACKOFF ** attempt, POLL_MAX_DELAY)
+
+
+def encode(response):
+    return base64.b64encode(json.dumps(response).encode("ascii"))
+
+
+def stopped_by_revoke(plugin_name, project_id, resource_id, run_id):
+    """
+        Follow-up tasks have their own task ids, revoke_tasks only reaches the run
+        id: a revoked run stores a TIMEOUT result and goes no further
+    """
+    if not run_id or not InFlight.is_revoked(run_id):
+        return False
+
+    PluginManager.set_plugin_results(
+        resource_id, plugin_name, project_id, None, PluginResultStatus.TIMEOUT
+    )
+    return True
+
+
+@celery_app.task(bind=True)
+def urlscan(self, plugin_name, project_id, resource_id, resource_type, url):
+    """
+        First step: submit the scan and hand it off to urlscan_poll,
+        so no worker slot is held while urlscan.io works on it
+    """
     result_status = PluginResultStatus.STARTED
     response = {}
 
@@ -98,7 +136,7 @@ def urlscan(plugin_name, project_id, resource_id, resource_type, url):
                 "API-Key": API_KEY,
             }
             data = {"url": url, "visibility": "public"}
-            url_submission_response = requests.post(
+            url_submission_response = http("urlscan").post(
                 SUBMISSION_URL, headers=headers, json=data
             )
             if not url_submission_response.status_code == 200:
@@ -109,42 +147,151 @@ def urlscan(plugin_name, project_id, resource_id, resource_type, url):
 
             else:
                 uuid = json.loads(url_submission_response.content)["uuid"]
+                urlscan_poll.apply_async(
+                    kwargs={
+                        "plugin_name": plugin_name,
+                        "project_id": project_id,
+                        "resource_id": resource_id,
+                        "resource_type": resource_type,
+                        "uuid": uuid,
+                        "run_id": self.request.id,
+                    },
+                    countdown=POLL_FIRST_DELAY,
+                    queue=PLUGIN_QUEUE,
+                )
+                return HANDED_OFF
+
+        PluginManager.set_plugin_results(
+            resource_id, plugin_name, project_id, response, result_status
+        )
+
+    except Exception as e:
+        tb1 = traceback.TracebackException.from_exception(e)
+        print("".join(tb1.format()))
+        return None
 
-                SLEEP_LIMIT = 300
-                SLEEP_DELTA_INCREMENT = 2.5
-                SLEEP_FRAME = 2
-                # Número de reintentos cada 2 segundos
-                while SLEEP_FRAME < SLEEP_LIMIT:
-                    response = result(uuid)
-                    if response is not None:
-                        break
-                    SLEEP_FRAME = round(SLEEP_FRAME * SLEEP_DELTA_INCREMENT)
-                    time.sleep(SLEEP_FRAME)
-
-                if response:
-                    if response.get("message"):
-                        # message means problems
-                        result_status = PluginResultStatus.FAILED
-                        print(f"[urlscan.plugin] {response}")
-                    else:
-                        result_status = PluginResultStatus.COMPLETED
-                        task = response.get("task")
-                        if task:
-                            screenshot_url = task.get("screenshotURL")
-                            if screenshot_url:
-                                screenshot_name = urlscan_screenshot(screenshot_url)
-                                if screenshot_name:
-                                    response["screenshot"] = screenshot_name
-                        response = base64.b64encode(
-                            json.dumps(response).encode("ascii")
-                        )
-
-                else:
-                    result_status = PluginResultStatus.RETURN_NONE
 
+@celery_app.task(bind=True)
+def urlscan_poll(
+    self,
+    plugin_name,
+    project_id,
+    resource_id,
+    resource_type,
+    uuid,
+    run_id=None,
+    attempt=0,
+    waited=0,
+):
+    """
+        Second step: a single check of the scan result. While it is not ready the
+        task is re-enqueued with a growing countdown, uuid, attempt and waited
+        carry the state between checks. run_id is the task id of the urlscan run
+    """
+    response = None
+    try:
+        if stopped_by_revoke(plugin_name, project_id, resource_id, run_id):
+            return None
+
+        response = result(uuid)
+
+    except Exception as e:
+        tb1 = traceback.TracebackException.from_exception(e)
+        print("".join(tb1.format()))
+
+    # Out of the try block, defer raises to reschedule the task
+    if response is None and waited < POLL_LIMIT:
+        delay = poll_delay(attempt)
+        defer(
+            self,
+            delay,
+            kwargs={
+                **self.request.kwargs,
+                "attempt": attempt + 1,
+                "waited": waited + delay,
+            },
+        )
+
+    try:
+        if not response:
+            result_status = PluginResultStatus.RETURN_NONE
+            response = {}
+
+        elif response.get("message"):
+            # message means problems
+            result_status = PluginResultStatus.FAILED
+            print(f"[urlscan.plugin] {response}")
+
+        else:
+            screenshot_url = (response.get("task") or {}).get("screenshotURL")
+            if screenshot_url:
+                urlscan_screenshot.apply_async(
+                    kwargs={
+                        "plugin_name": plugin_name,
+                        "project_id": project_id,
+                        "resource_id": resource_id,
+                        "resource_type": resource_type,
+                        "uuid": uuid,
+                        "screenshot_url": screenshot_url,
+                        "run_id": run_id,
+                    },
+                    queue=PLUGIN_QUEUE,
+                )
+                return HANDED_OFF
+
+            result_status = PluginResultStatus.COMPLETED
+            response = encode(response)
+
+        PluginManager.set_plugin_results(
+            resource_id, plugin_name, project_id, response, result_status
+        )
+
+    except Exception as e:
+        tb1 = traceback.TracebackException.from_exception(e)
+        print("".join(tb1.format()))
+        return None
+
+
+@celery_app.task
+def urlscan_screenshot(
+    plugin_name,
+    project_id,
+    resource_id,
+    resource_type,
+    uuid,
+    screenshot_url,
+    run_id=None,
+):
+    """
+        Last step: store the screenshot along with the scan result. The result is
+        fetched again here instead of travelling through the broker
+    """
+    try:
+        if stopped_by_revoke(plugin_name, project_id, resource_id, run_id):
+            return None
+
+        response = result(uuid)
+        if not response:
             PluginManager.set_plugin_results(
-                resource_id, plugin_name, project_id, response, result_status
+                resource_id,
+                plugin_name,
+                project_id,
+                {},
+                PluginResultStatus.RETURN_NONE,
             )
+            return None
+
+        screenshot_name = download_screenshot(screenshot_url)
+        if screenshot_name:
+            response["screenshot"] = screenshot_name
+
+        PluginManager.set_plugin_results(
+            resource_id,
+            plugin_name,
+            project_id,
+            encode(response),
+            PluginResultStatus.COMPLETED,
+        )
 
     except Exception as e:
         tb1 = traceback.TracebackException.from_exception(e)
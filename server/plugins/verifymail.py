@@ -22,6 +22,10 @@ PLUGIN_DISABLE = False
 PLUGIN_IS_ACTIVE = False
 PLUGIN_NAME = "verifymail"
 PLUGIN_NEEDS_API_KEY = True
+PLUGIN_TASK = "verifymail"
+PLUGIN_TASK_TARGET = {"email": "searchable"}
+PLUGIN_QUEUE = "slow_io"
+PLUGIN_FRESHNESS = 86400  # 24 hours
 
 API_KEY = KeyRing().get("verify-email")
 API_KEY_IN_DDBB = bool(API_KEY)
@@ -1,11 +1,16 @@
 import traceback
 import json
-import requests
 import base64
 
 from tasks.api_keys import KeyRing
 from tasks.tasks import celery_app
+from tasks.http_client import http
+from tasks.micro_batcher import MicroBatcher
+from tasks.rate_limiter import RateLimiter, defer, rate_limit
+from server.entities.inflight import InFlight, HANDED_OFF
+from server.entities.quota_ledger import QuotaLedger
 from server.entities.plugin_manager import PluginManager
+from server.entities.plugin_runs import PluginRuns
 from server.entities.resource_types import ResourceType
 from server.entities.plugin_result_types import PluginResultStatus
 
@@ -31,12 +36,23 @@ PLUGIN_DISABLE = False
 PLUGIN_IS_ACTIVE = False
 PLUGIN_NAME = "virustotal"
 PLUGIN_NEEDS_API_KEY = True
+PLUGIN_TASK = "virustotal"
+PLUGIN_TASK_TARGET = {"target": "searchable"}
+PLUGIN_QUEUE = "slow_io"
+PLUGIN_FRESHNESS = 21600  # 6 hours
 
 API_KEY = KeyRing().get("virustotal")
 API_KEY_IN_DDBB = bool(API_KEY)
 API_KEY_DOC = "https://developers.virustotal.com/reference"
 API_KEY_NAMES = ["virustotal"]
 
+# Hashes and URLs are looked up in batches: the report endpoints accept several
+# resources per call, 4 at most with public API keys. A batch costs one call of
+# the rate limit and the quota.
+BATCH_SIZE = 4
+BATCH_URLS = {ResourceType.HASH: url_for_hashes, ResourceType.URL: url_for_urls}
+BATCH_SEPARATORS = {ResourceType.HASH: ",", ResourceType.URL: "\n"}
+
 
 class Plugin:
     def __init__(self, resource, project_id):
@@ -68,8 +84,22 @@ class Plugin:
             print("".join(tb1.format()))
 
 
-@celery_app.task
-def virustotal(plugin_name, project_id, resource_id, resource_type, target):
+@celery_app.task(bind=True)
+def virustotal(self, plugin_name, project_id, resource_id, resource_type, target):
+    batcher = BATCHERS.get(ResourceType(resource_type))
+    if batcher and batcher.add(
+        {
+            "plugin_name": plugin_name,
+            "project_id": project_id,
+            "resource_id": resource_id,
+            "target": target,
+            "run_id": self.request.id,
+        }
+    ):
+        return HANDED_OFF
+
+    rate_limit(self, "virustotal")
+
     result_status = PluginResultStatus.STARTED
     response = None
 
@@ -79,6 +109,10 @@ def virustotal(plugin_name, project_id, resource_id, resource_type, target):
             print("No API key...!")
             result_status = PluginResultStatus.NO_API_KEY
 
+        elif QuotaLedger.is_exhausted("virustotal"):
+            print("[VT]: Quota exhausted")
+            result_status = PluginResultStatus.QUOTA_EXCEEDED
+
         else:
             response = None
             url = None
@@ -102,15 +136,22 @@ def virustotal(plugin_name, project_id, resource_id, resource_type, target):
                 print("[VT]: Unknown resource type before querying service")
                 result_status = PluginResultStatus.FAILED
 
-            response = requests.get(url, params=params)
+            QuotaLedger.record("virustotal", API_KEY)
+            response = http("virustotal").get(url, params=params)
 
-            if not response.status_code == 200:
+            # 204 and 429 are the answers of an exceeded request rate or quota
+            if response.status_code in [204, 429]:
+                response = None
+                result_status = PluginResultStatus.QUOTA_EXCEEDED
+            elif not response.status_code == 200:
+                response = None
                 result_status = PluginResultStatus.RETURN_NONE
             else:
                 response = response.content
                 result_status = PluginResultStatus.COMPLETED
 
-        response = base64.b64encode(response)
+        if response:
+            response = base64.b64encode(response)
 
         PluginManager.set_plugin_results(
             resource_id, plugin_name, project_id, response, result_status
@@ -120,3 +161,149 @@ def virustotal(plugin_name, project_id, resource_id, resource_type, target):
         tb1 = traceback.TracebackException.from_exception(e)
         print("".join(tb1.format()))
         return None
+
+
+def split_batch(items, reports):
+    """
+        Report of every item. They come in the order of the query, resources
+        missing from the answer are matched by name
+    """
+    if isinstance(reports, dict):
+        reports = [reports]
+    if len(reports) == len(items):
+        return reports
+
+    by_resource = {report.get("resource"): report for report in reports}
+    return [by_resource.get(item["target"]) for item in items]
+
+
+def is_revoked(item):
+    return bool(item.get("run_id")) and InFlight.is_revoked(item["run_id"])
+
+
+def store_batch_item(item, response, item_status):
+    """
+        Store the result of a batched item, returns (run id, stored status),
+        None for items without a run id
+    """
+    PluginRuns.context.result_status = None
+    try:
+        # The lease is held by the virustotal task which handed the item off
+        PluginManager.set_plugin_results(
+            item["resource_id"],
+            item["plugin_name"],
+            item["project_id"],
+            response,
+            item_status,
+            task_id=item.get("run_id"),
+        )
+
+    except Exception as e:
+        tb1 = traceback.TracebackException.from_exception(e)
+        print("".join(tb1.format()))
+
+    if not item.get("run_id"):
+        return None
+    return (item["run_id"], PluginRuns.context.result_status or item_status)
+
+
+@celery_app.task(bind=True)
+def virustotal_batch(self, resource_type, items=None):
+    """
+        Flush of a batch of virustotal tasks, items carry them while the task
+        is deferred by the rate limiter
+    """
+    resource_type_for_vt = ResourceType(resource_type)
+    if items is None:
+        items = BATCHERS[resource_type_for_vt].take()
+    if not items:
+        return
+
+    # Runs revoked while their item waited are not looked up
+    flags = [is_revoked(item) for item in items]
+    revoked = [item for item, flag in zip(items, flags) if flag]
+    if revoked:
+        items = [item for item, flag in zip(items, flags) if not flag]
+        PluginRuns.context.reset(self.request.id)
+        PluginRuns.finished_batch(
+            [
+                store_batch_item(item, None, PluginResultStatus.TIMEOUT)
+                for item in revoked
+            ]
+        )
+    if not items:
+        return
+
+    # Out of the try block, defer raises to reschedule the task
+    wait = RateLimiter.acquire("virustotal")
+    if wait:
+        defer(self, wait, kwargs={**self.request.kwargs, "items": items})
+
+    # Calls and bytes of the batch, shared between the runs of its items
+    PluginRuns.context.reset(self.request.id)
+    result_status = PluginResultStatus.STARTED
+    responses = [None] * len(items)
+
+    try:
+        API_KEY = KeyRing().get("virustotal")
+        if not API_KEY:
+            print("No API key...!")
+            result_status = PluginResultStatus.NO_API_KEY
+
+        elif QuotaLedger.is_exhausted("virustotal"):
+            print("[VT]: Quota exhausted")
+            result_status = PluginResultStatus.QUOTA_EXCEEDED
+
+        else:
+            separator = BATCH_SEPARATORS[resource_type_for_vt]
+            params = {
+                "apikey": API_KEY,
+                "resource": separator.join(item["target"] for item in items),
+            }
+
+            QuotaLedger.record("virustotal", API_KEY)
+            response = http("virustotal").get(
+                BATCH_URLS[resource_type_for_vt], params=params
+            )
+
+            # 204 and 429 are the answers of an exceeded request rate or quota
+            if response.status_code in [204, 429]:
+                result_status = PluginResultStatus.QUOTA_EXCEEDED
+            elif not response.status_code == 200:
+                result_status = PluginResultStatus.RETURN_NONE
+            else:
+                reports = split_batch(items, json.loads(response.content))
+                responses = [
+                    base64.b64encode(json.dumps(report).encode("utf-8"))
+                    if report
+                    else None
+                    for report in reports
+                ]
+                result_status = PluginResultStatus.COMPLETED
+
+    except Exception as e:
+        tb1 = traceback.TracebackException.from_exception(e)
+        print("".join(tb1.format()))
+        result_status = PluginResultStatus.FAILED
+
+    run_statuses = []
+    for item, response in zip(items, responses):
+        item_status = result_status
+        if result_status == PluginResultStatus.COMPLETED and not response:
+            item_status = PluginResultStatus.RETURN_NONE
+
+        run_status = store_batch_item(item, response, item_status)
+        if run_status:
+            run_statuses.append(run_status)
+
+    PluginRuns.finished_batch(run_statuses)
+
+
+BATCHERS = {
+    resource_type: MicroBatcher(
+        f"virustotal:{resource_type.value}",
+        virustotal_batch.si(resource_type=resource_type.value).set(queue=PLUGIN_QUEUE),
+        BATCH_SIZE,
+    )
+    for resource_type in BATCH_URLS
+}
@@ -19,6 +19,10 @@ PLUGIN_DISABLE = False
 PLUGIN_NAME = "whois"
 PLUGIN_IS_ACTIVE = False
 PLUGIN_NEEDS_API_KEY = False
+PLUGIN_TASK = "whois"
+PLUGIN_TASK_TARGET = {"domain": "domain"}
+PLUGIN_QUEUE = "fast"
+PLUGIN_FRESHNESS = 86400  # 24 hours
 
 API_KEY = False
 API_KEY_IN_DDBB = False
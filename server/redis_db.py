@@ -0,0 +1,25 @@
+import os
+import threading
+
+import redis
+
+REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379/0")
+
+
+class RedisRegistry:
+    """
+        Process-wide Redis client, shared by the web and worker processes for
+        coordination state (rate limits, in-flight plugin tasks...).
+        The connection pool of redis-py already reconnects after a fork.
+    """
+
+    _lock = threading.Lock()
+    _client = None
+
+    @classmethod
+    def get_client(cls):
+        if cls._client is None:
+            with cls._lock:
+                if cls._client is None:
+                    cls._client = redis.Redis.from_url(REDIS_URL)
+        return cls._client
@@ -2,8 +2,12 @@ import sys
 
 sys.path.append(".")
 
-from server.entities.plugin_manager import register_plugins
+from server.entities.plugin_manager import register_plugins, PluginManager
 from server.db import check_database_version, migrate_database
+from server.indexes import ensure_indexes, index_report, print_index_report
+
+# Only report missing or unused indexes, do not create anything
+DRY_RUN_INDEXES = "--dry-run-indexes" in sys.argv
 
 
 # Register plugins
@@ -19,3 +23,14 @@ if not needs:
 else:
     print("[thethe_server]: Your database is old, migrating")
     migrate_database()
+
+
+# Bootstrap and verify indexes
+plugin_names = [plugin["name"] for plugin in PluginManager.get_all()]
+if DRY_RUN_INDEXES:
+    print("[thethe_server]: Index dry run, nothing will be created")
+else:
+    print("[thethe_server]: Ensuring database indexes")
+    ensure_indexes(plugin_names)
+
+print_index_report(index_report(plugin_names))
@@ -9,6 +9,8 @@ from flask import Blueprint, request, abort, jsonify
 from server.db import DB
 from server.utils.tokenizer import token_required
 from server.entities.plugin_manager import PluginManager
+from server.entities.plugin_registry import PluginRegistry
+from server.entities.quota_ledger import QuotaLedger
 
 apikeys_api = Blueprint("apikeys", __name__)
 
@@ -55,10 +57,14 @@ def upload_apikeys(user):
     try:
         apikeys = request.json["entries"]
         for apikey in apikeys:
+            fields = {"apikey": apikey["value"].strip()}
+
+            # Optional rate limit tier of the key, see tasks/rate_limiter.py
+            if apikey.get("tier"):
+                fields["tier"] = apikey["tier"]
+
             result = DB("apikeys").collection.update_one(
-                {"name": apikey["name"]},
-                {"$set": {"apikey": apikey["value"].strip()}},
-                upsert=True,
+                {"name": apikey["name"]}, {"$set": fields}, upsert=True,
             )
 
             # Also updating "plugins" metadata
@@ -67,6 +73,9 @@ def upload_apikeys(user):
                 {"apikey_names": apikey["name"]}, {"$set": {"apikey_in_ddbb": True}}
             )
 
+        # Every process reloads its plugin registry
+        PluginRegistry.bump()
+
         return json.dumps({"success_message": "Apikeys saved"}, default=str)
 
     except Exception as e:
@@ -74,3 +83,22 @@ def upload_apikeys(user):
         tb1 = traceback.TracebackException.from_exception(e)
         print("".join(tb1.format()))
         return jsonify({"error_message": "Error uploading API keys"}), 400
+
+
+@apikeys_api.route("/api/get_quotas", methods=["POST"])
+@token_required
+def get_quotas(user):
+    """
+        Calls made and remaining budget of every provider with a quota
+    """
+    try:
+        if not user.get("is_admin"):
+            return jsonify({"error_message": "User is not admin"}), 400
+
+        return jsonify(QuotaLedger.report())
+
+    except Exception as e:
+        print(f"[routes/apikeys.get_quotas]: {e}")
+        tb1 = traceback.TracebackException.from_exception(e)
+        print("".join(tb1.format()))
+        return jsonify({"error_message": "Error getting quotas"}), 400
@@ -11,9 +11,11 @@ from flask import Blueprint, request, abort, jsonify
 from server.utils.tokenizer import token_required
 
 from server.entities.plugin_manager import PluginManager
+from server.entities.plugin_runs import PluginRuns, RUNS_RETENTION
 from server.entities.resource_types import ResourceType, ResourceTypeException
 from server.entities.user import User
 from server.entities.pastebin_manager import PastebinManager
+from server.entities.project import Project
 from server.entities.resource_base import Resource
 
 plugins_api = Blueprint("plugins", __name__)
@@ -51,18 +53,89 @@ def launch_plugin(user):
     try:
         resource_id = bson.ObjectId(request.json["resource_id"])
         plugin_name = request.json["plugin_name"]
+        # Bypass the plugin freshness window and query the provider again
+        force = bool(request.json.get("force", False))
 
         project = User(user.get("_id")).get_active_project()
         resource = Resource(resource_id)
 
-        resource.launch_plugin(project.get_id(), plugin_name)
-        return jsonify({"sucess_message": "ok"})
+        # No task id when a fresh stored result is served instead
+        task_id = resource.launch_plugin(project.get_id(), plugin_name, force=force)
+        return jsonify({"sucess_message": "ok", "task_id": task_id})
 
     except Exception as e:
         print(f"[launch_plugin]: {e}")
         return jsonify({"error_message": "Error launching plugin"}), 400
 
 
+@plugins_api.route("/api/revoke_tasks", methods=["POST"])
+@token_required
+def revoke_tasks(user):
+    """
+        Stop the running plugin tasks of a resource, or of every resource of a
+        project. Returns the revoked tasks.
+    """
+    try:
+        if not user.get("is_admin"):
+            return jsonify({"error_message": "User is not admin"}), 400
+
+        if request.json.get("resource_id"):
+            resource_ids = [bson.ObjectId(request.json["resource_id"])]
+        elif request.json.get("project_id"):
+            resource_ids = Project(request.json["project_id"]).get_resources()
+        else:
+            return jsonify({"error_message": "resource_id or project_id needed"}), 400
+
+        revoked = PluginManager.revoke_tasks(resource_ids)
+        return jsonify({"sucess_message": "ok", "revoked": revoked})
+
+    except Exception as e:
+        print(f"[revoke_tasks]: {e}")
+        tb1 = traceback.TracebackException.from_exception(e)
+        print("".join(tb1.format()))
+        return jsonify({"error_message": "Error revoking tasks"}), 400
+
+
+@plugins_api.route("/api/get_plugin_runs", methods=["POST"])
+@token_required
+def get_plugin_runs(user):
+    """
+        Latest plugin runs of a resource: queued, running, lost or finished
+    """
+    try:
+        resource_id = bson.ObjectId(request.json["resource_id"])
+        return jsonify(PluginRuns.for_resource(resource_id))
+
+    except Exception as e:
+        print(f"[get_plugin_runs]: {e}")
+        tb1 = traceback.TracebackException.from_exception(e)
+        print("".join(tb1.format()))
+        return jsonify({"error_message": "Error getting plugin runs"}), 400
+
+
+@plugins_api.route("/api/get_plugin_stats", methods=["POST"])
+@token_required
+def get_plugin_stats(user):
+    """
+        p50/p95 of queue wait, run time, calls and bytes per plugin, for the runs
+        finished in the last "hours" (24 by default)
+    """
+    try:
+        if not user.get("is_admin"):
+            return jsonify({"error_message": "User is not admin"}), 400
+
+        # Runs are not kept longer than RUNS_RETENTION anyway
+        hours = float((request.json or {}).get("hours", 24))
+        hours = min(hours, RUNS_RETENTION.total_seconds() / 3600)
+        return jsonify(PluginRuns.stats(time.time() - hours * 3600))
+
+    except Exception as e:
+        print(f"[get_plugin_stats]: {e}")
+        tb1 = traceback.TracebackException.from_exception(e)
+        print("".join(tb1.format()))
+        return jsonify({"error_message": "Error getting plugin stats"}), 400
+
+
 @plugins_api.route("/api/load_paste", methods=["POST"])
 @token_required
 def load_paste(user):
@@ -5,16 +5,25 @@ import traceback
 import urllib.parse
 
 from bson.json_util import dumps
-from flask import Blueprint, request, abort, jsonify
+from flask import Blueprint, request, abort, jsonify, Response, stream_with_context
 
 from server.utils.tokenizer import token_required
 
 from server.entities.resource_manager import ResourceManager
+from server.entities.resource_base import Resource
+from server.entities.plugin_manager import PluginManager
 
 from server.entities.resource_types import ResourceType, ResourceTypeException
+from server.entities.ioc_classifier import classify, extract
 from server.entities.user import User
 from server.entities.project import Project
 
+# Max number of indicators accepted by a single bulk ingestion request
+BULK_RESOURCES_LIMIT = 20000
+
+# Max size, in characters, of the free text of a bulk ingestion request
+BULK_TEXT_LIMIT = 5 * 1024 * 1024
+
 resources_api = Blueprint("resources", __name__)
 
 
@@ -33,10 +42,13 @@ def create_resource(user):
         project.add_resource(resource)
 
         response = []
-        response.append(resource.to_JSON())
+        resource_json = resource.to_JSON()
 
+        # Celery group of the autostart plugins, the client can track it
         if created:
-            resource.launch_plugins(project.get_id())
+            resource_json["group_id"] = resource.launch_plugins(project.get_id())
+
+        response.append(resource_json)
 
         # Deal with the case of URL resources where we have the chance to add a Domain or IP
         if resource.get_type() == ResourceType.URL:
@@ -47,15 +59,17 @@ def create_resource(user):
                     ip_or_domain, resource_type
                 )
                 project.add_resource(resource)
+                group_id = (
+                    resource.launch_plugins(project.get_id()) if created else None
+                )
                 response.append(
                     {
                         "success_message": f"Added new resource: {ip_or_domain}",
                         "new_resource": resource.to_JSON(),
                         "type": resource.get_type_value(),
+                        "group_id": group_id,
                     }
                 )
-                if created:
-                    resource.launch_plugins(project.get_id())
 
         # TODO: Deal with the case of domain -> IP
         # TODO: Deal with the case of emails -> domains -> IP
@@ -71,19 +85,177 @@ def create_resource(user):
         return jsonify({"error_message": "Server error :("}), 400
 
 
+def _stream_resources(resources, stream_format):
+    """
+        Serialize resources one by one, either as a chunked JSON array or as NDJSON
+    """
+    if stream_format == "ndjson":
+        for resource in resources:
+            yield json.dumps(resource.resource_json()) + "\n"
+        return
+
+    yield "["
+    separator = ""
+    for resource in resources:
+        yield separator + json.dumps(resource.resource_json())
+        separator = ","
+    yield "]"
+
+
+def _classify_resources(resource_names, text=""):
+    """
+        Single pass over the received names and the indicators extracted from
+        free text: dedup, detect their type and add the domain or IP of every URL,
+        like create_resource does.
+        Returns (entries as (name, ResourceType), rejected names)
+    """
+    entries = []
+    rejected = []
+    seen = set()
+
+    classified = [
+        (str(resource_name).strip(), None) for resource_name in resource_names
+    ]
+    if text:
+        classified.extend(extract(text))
+
+    for resource_name, resource_type in classified:
+        if not resource_name or resource_name in seen:
+            continue
+        seen.add(resource_name)
+
+        if not resource_type:
+            resource_type = classify(resource_name)
+
+        if resource_type == ResourceType.UNKNOWN:
+            rejected.append(resource_name)
+            continue
+
+        entries.append((resource_name, resource_type))
+
+        if resource_type == ResourceType.URL:
+            ip_or_domain = urllib.parse.urlparse(resource_name).netloc
+            if ip_or_domain and not ip_or_domain in seen:
+                seen.add(ip_or_domain)
+                entries.append(
+                    (ip_or_domain, ResourceType.validate_ip_or_domain(ip_or_domain))
+                )
+
+    return (entries, rejected)
+
+
+@resources_api.route("/api/create_resources", methods=["POST"])
+@token_required
+def create_resources(user):
+    """
+        Bulk ingestion of indicators into the active project.
+        "resources" is a list of names, their types are detected.
+        Optional "text" is a free text blob (report, paste...) whose indicators,
+        even defanged ones, are extracted and added too.
+    """
+    try:
+        resource_names = request.json.get("resources", [])
+        text = request.json.get("text", "")
+
+        # Refuse oversized requests before classifying or extracting anything
+        if len(resource_names) > BULK_RESOURCES_LIMIT:
+            return (
+                jsonify(
+                    {
+                        "error_message": f"Too many resources, the limit is {BULK_RESOURCES_LIMIT}"
+                    }
+                ),
+                400,
+            )
+
+        if len(text) > BULK_TEXT_LIMIT:
+            return (
+                jsonify(
+                    {
+                        "error_message": f"Text too long, the limit is {BULK_TEXT_LIMIT} characters"
+                    }
+                ),
+                400,
+            )
+
+        entries, rejected = _classify_resources(resource_names, text)
+        if len(entries) > BULK_RESOURCES_LIMIT:
+            return (
+                jsonify(
+                    {
+                        "error_message": f"Too many resources, the limit is {BULK_RESOURCES_LIMIT}"
+                    }
+                ),
+                400,
+            )
+
+        results = ResourceManager.bulk_get_or_create(entries)
+
+        project = User(user.get("_id")).get_active_project()
+        project.add_resources([resource for resource, created in results])
+
+        created_resources = [resource for resource, created in results if created]
+        group_ids, quota_dropped = PluginManager.launch_autostart_bulk(
+            created_resources, project.get_id()
+        )
+
+        return jsonify(
+            {
+                "success_message": f"Added {len(results)} resources, {len(created_resources)} new",
+                "resources": [resource.resource_json() for resource, created in results],
+                "rejected": rejected,
+                "group_ids": group_ids,
+                "quota_dropped": quota_dropped,
+            }
+        )
+
+    except Exception as e:
+        tb1 = traceback.TracebackException.from_exception(e)
+        print("".join(tb1.format()))
+        return jsonify({"error_message": "Server error :("}), 400
+
+
 @resources_api.route("/api/get_resources", methods=["POST"])
 @token_required
 def get_resources(user):
+    """
+        Stream the resources of a project.
+        Optional "cursor" (last resource_id received) and "limit" paginate the list,
+        the next cursor is returned in the X-Next-Cursor header.
+        "format": "ndjson" returns one resource per line instead of a JSON array.
+    """
     try:
         project_id = request.json["project_id"]
+        cursor = request.json.get("cursor")
+        limit = request.json.get("limit")
+        stream_format = request.json.get("format", "json")
+
         project = Project(project_id)
-        resources = project.get_resources()
+        resource_ids = sorted(project.get_resources())
 
-        results = []
-        for resource in resources:
-            results.append(ResourceManager.get(resource).resource_json())
+        if cursor:
+            cursor = bson.ObjectId(cursor)
+            resource_ids = [
+                resource_id for resource_id in resource_ids if resource_id > cursor
+            ]
 
-        return jsonify(results)
+        next_cursor = None
+        if limit and len(resource_ids) > int(limit):
+            resource_ids = resource_ids[: int(limit)]
+            next_cursor = str(resource_ids[-1])
+
+        resources = ResourceManager.get_many(resource_ids)
+
+        response = Response(
+            stream_with_context(_stream_resources(resources, stream_format)),
+            mimetype="application/x-ndjson"
+            if stream_format == "ndjson"
+            else "application/json",
+        )
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+
+        return response
 
     except Exception as e:
         print(f"Error getting resource list {e}")
@@ -171,6 +343,35 @@ def get_lazy_plugin_results(user):
         return jsonify({"error_message": "Error getting resources"}), 400
 
 
+@resources_api.route("/api/get_plugin_snapshot", methods=["POST"])
+@token_required
+def get_plugin_snapshot(user):
+    """
+        Return only one plugin results at a selected history snapshot
+    """
+
+    resource_id = request.json["params"]["resource_id"]
+    plugin_name = request.json["params"]["plugin_name"]
+    timestamp_index = request.json["params"].get("timestamp_index", 0)
+
+    try:
+        # plugin_name is a collection name, do not let it point anywhere else
+        if not PluginManager.is_registered(plugin_name):
+            return jsonify({"error_message": "Unknown plugin"}), 400
+
+        snapshot = Resource.get_plugin_snapshot(
+            resource_id, plugin_name, int(timestamp_index)
+        )
+        if snapshot:
+            return jsonify(snapshot)
+        else:
+            return jsonify({"error_message": "Plugin results not found"})
+
+    except Exception as e:
+        print(f"[get_plugin_snapshot]: Error getting plugin snapshot {e}")
+        return jsonify({"error_message": "Error getting plugin results"}), 400
+
+
 @resources_api.route("/api/get_full_resource", methods=["POST"])
 @token_required
 def get_full_resource(user):
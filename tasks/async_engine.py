@@ -0,0 +1,136 @@
+import asyncio
+import contextvars
+import os
+import threading
+
+import aiohttp
+
+from tasks.tasks import celery_app
+from server.entities.plugin_runs import PluginRuns
+
+# Connections the shared session keeps open to providers, per worker process
+ASYNC_CONNECTIONS = int(os.environ.get("THETHE_ASYNC_CONNECTIONS", 200))
+
+# Default total timeout of a provider call, in seconds
+ASYNC_TIMEOUT = 30
+
+# (task_id, state) of the plugin run a coroutine works for, see PluginRuns
+CURRENT_RUN = contextvars.ContextVar("current_run", default=None)
+
+
+async def _count_call(session, trace_config_ctx, params):
+    run = CURRENT_RUN.get()
+    if run:
+        run[1].add(calls=1)
+
+
+async def _count_chunk(session, trace_config_ctx, params):
+    run = CURRENT_RUN.get()
+    if run:
+        run[1].add(received=len(params.chunk))
+
+
+def _metrics_trace_config():
+    """
+        Calls and bytes received through the shared session count for the plugin
+        run of the calling coroutine, like tasks.http_client metrics hooks do
+    """
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_end.append(_count_call)
+    trace_config.on_request_exception.append(_count_call)
+    trace_config.on_response_chunk_received.append(_count_chunk)
+    return trace_config
+
+
+class EventLoop:
+    """
+        Process-wide asyncio loop running in a daemon thread, with one shared
+        aiohttp session. The threads of an async_io worker (celery --pool=threads)
+        submit their coroutines to it and wait for them, so a single process keeps
+        hundreds of provider calls in flight instead of one per prefork slot.
+        Like the Mongo client, it is keyed by pid and rebuilt after a fork.
+    """
+
+    _lock = threading.Lock()
+    _loop = None
+    _session = None
+    _pid = None
+
+    @staticmethod
+    async def _new_session():
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=ASYNC_CONNECTIONS),
+            timeout=aiohttp.ClientTimeout(total=ASYNC_TIMEOUT),
+            trace_configs=[_metrics_trace_config()],
+        )
+
+    @classmethod
+    def get(cls):
+        pid = os.getpid()
+        if cls._loop is None or cls._pid != pid:
+            with cls._lock:
+                if cls._loop is None or cls._pid != pid:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(
+                        target=loop.run_forever, name="thethe-event-loop", daemon=True
+                    ).start()
+                    cls._session = asyncio.run_coroutine_threadsafe(
+                        cls._new_session(), loop
+                    ).result()
+                    cls._loop = loop
+                    cls._pid = pid
+        return (cls._loop, cls._session)
+
+    @classmethod
+    def run(cls, coroutine_function, *args, **kwargs):
+        """
+            Run an async plugin function on the process loop, blocking the caller
+        """
+        loop, session = cls.get()
+        run = PluginRuns.context.run
+
+        async def in_run():
+            # Set in the context of this asyncio task only
+            CURRENT_RUN.set(run)
+            return await coroutine_function(session, *args, **kwargs)
+
+        return asyncio.run_coroutine_threadsafe(in_run(), loop).result()
+
+
+async def run_sync(function, *args, **kwargs):
+    """
+        Adapter for synchronous code inside async plugins (pymongo through
+        PluginManager, KeyRing, helpers of sync plugins...): it runs in the loop
+        executor so it does not stall other in-flight calls
+    """
+    loop = asyncio.get_event_loop()
+    run = CURRENT_RUN.get()
+
+    def call():
+        # Results stored from the executor belong to the run of the coroutine
+        PluginRuns.context.attach(run)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            PluginRuns.context.reset()
+
+    return await loop.run_in_executor(None, call)
+
+
+def async_task(coroutine_function):
+    """
+        Register an async plugin function as a celery task.
+        The function receives the shared aiohttp session as first argument:
+            @async_task
+            async def plugin(session, plugin_name, ..., target):
+        The task keeps the registered name server.plugins.<module>.<function>,
+        route it to the async_io queue (PLUGIN_QUEUE = "async_io").
+        Sync plugins need no change: routed to async_io they run on the worker threads.
+    """
+    name = f"{coroutine_function.__module__}.{coroutine_function.__name__}"
+
+    @celery_app.task(name=name)
+    def task(*args, **kwargs):
+        return EventLoop.run(coroutine_function, *args, **kwargs)
+
+    return task
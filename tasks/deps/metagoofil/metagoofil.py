@@ -135,7 +135,8 @@ class Metagoofil:
         self.total_bytes = 0
 
     def go(self):
-        all_files = []
+        # An attribute, so a caller stopping the search can read what was found
+        all_files = self.all_files = []
 
         # Kickoff the threadpool.
         for i in range(self.number_of_threads):
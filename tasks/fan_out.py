@@ -0,0 +1,42 @@
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from server.entities.plugin_runs import PluginRuns
+
+# Sub-requests a plugin task keeps in flight at once, per task. Keep it under
+# POOL_SIZE of tasks/http_client.py so every thread gets a keep-alive connection
+FAN_OUT_WORKERS = 6
+
+
+def fan_out(function, items, max_workers=FAN_OUT_WORKERS):
+    """
+        Call function(item) for every item from a bounded thread pool, so the
+        sub-requests of a plugin (tabs, pages, sub-documents...) take as long as
+        the slowest one instead of the sum of all of them.
+        Returns the results in the order of items, None for calls that raised.
+        Rate limited providers must reserve the whole fan-out before calling it:
+            rate_limit(self, "threatminer", tokens=len(items))
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    # Calls made by the pool threads count for the run of the calling task
+    run = PluginRuns.context.run
+
+    def call(item):
+        PluginRuns.context.attach(run)
+        try:
+            return function(item)
+
+        except Exception as e:
+            print(f"[fan_out] {function.__name__}({item}): {e}")
+            tb1 = traceback.TracebackException.from_exception(e)
+            print("".join(tb1.format()))
+            return None
+
+        finally:
+            PluginRuns.context.reset()
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(call, items))
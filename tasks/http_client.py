@@ -0,0 +1,145 @@
+import os
+import random
+import threading
+import time
+import traceback
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# (connect, read) seconds used when a call does not give its own timeout
+DEFAULT_TIMEOUT = (5, 30)
+
+# Keep-alive connections kept per provider and host
+POOL_SIZE = int(os.environ.get("THETHE_HTTP_POOL_SIZE", 10))
+
+# Retries of failed connections, reads and throttled or failed answers
+RETRIES = 3
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+BACKOFF_FACTOR = 0.5
+
+# Longest sleep on a Retry-After header. Longer waits are shortened: once retries
+# are exhausted the caller gets the 429 answer and can defer the task instead
+MAX_RETRY_AFTER = 30
+
+# Calls slower than this are reported by the default metrics hook, in seconds
+SLOW_REQUEST = 10
+
+
+class JitteredRetry(Retry):
+    """
+        Exponential backoff with random jitter, so workers throttled together do
+        not retry together. Retry-After is honoured up to MAX_RETRY_AFTER.
+    """
+
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        return backoff + random.uniform(0, backoff) if backoff else 0
+
+    def sleep_for_retry(self, response=None):
+        retry_after = self.get_retry_after(response) if response is not None else None
+        if retry_after:
+            time.sleep(min(retry_after, MAX_RETRY_AFTER))
+            return True
+        return False
+
+
+class ProviderSession(requests.Session):
+    """
+        requests.Session with a default timeout: a hung provider must not pin a worker
+    """
+
+    def __init__(self, provider):
+        super().__init__()
+        self.provider = provider
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+        start = time.time()
+        try:
+            response = super().request(method, url, **kwargs)
+
+        except Exception as e:
+            _call_hooks(self.provider, method, url, None, time.time() - start, e)
+            raise
+
+        _call_hooks(self.provider, method, url, response, time.time() - start, None)
+        return response
+
+
+# Functions called after every provider call, with
+# (provider, method, url, response or None, elapsed seconds, exception or None)
+METRICS_HOOKS = []
+
+
+def add_metrics_hook(hook):
+    METRICS_HOOKS.append(hook)
+
+
+def _call_hooks(provider, method, url, response, elapsed, error):
+    for hook in METRICS_HOOKS:
+        try:
+            hook(provider, method, url, response, elapsed, error)
+        except Exception as e:
+            print(f"[http_client._call_hooks] {e}")
+            tb1 = traceback.TracebackException.from_exception(e)
+            print("".join(tb1.format()))
+
+
+def print_failed_or_slow(provider, method, url, response, elapsed, error):
+    if error:
+        print(f"[http_client]: {provider} {method} {url} failed: {error}")
+    elif response.status_code >= 400 or elapsed > SLOW_REQUEST:
+        status = response.status_code
+        print(f"[http_client]: {provider} {method} {url} {status} in {elapsed:.2f}s")
+
+
+add_metrics_hook(print_failed_or_slow)
+
+
+class HttpClients:
+    """
+        Per-process registry of pooled keep-alive sessions, one per provider,
+        so TLS handshakes are paid once per connection instead of once per call.
+        Keyed by pid: sockets must not be shared with forked children.
+    """
+
+    _lock = threading.Lock()
+    _sessions = {}
+    _pid = None
+
+    @staticmethod
+    def _new_session(provider):
+        retry = JitteredRetry(
+            total=RETRIES,
+            backoff_factor=BACKOFF_FACTOR,
+            status_forcelist=RETRY_STATUSES,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry
+        )
+        session = ProviderSession(provider)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    @classmethod
+    def get(cls, provider):
+        pid = os.getpid()
+        with cls._lock:
+            if cls._pid != pid:
+                cls._sessions = {}
+                cls._pid = pid
+            if not provider in cls._sessions:
+                cls._sessions[provider] = cls._new_session(provider)
+            return cls._sessions[provider]
+
+
+def http(provider):
+    """
+        Session to call a provider with, use it as the requests module:
+            http("shodan").get(url)
+    """
+    return HttpClients.get(provider)
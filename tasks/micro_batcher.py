@@ -0,0 +1,76 @@
+import json
+import traceback
+
+from server.redis_db import RedisRegistry
+
+# Seconds a batch waits for more items before it is flushed
+BATCH_WINDOW = 2
+
+# Pending items are dropped if no flush takes them in this time, in seconds.
+# Their in-flight leases expire as well, so the resources can be relaunched.
+BATCH_RETENTION = 600
+
+
+class MicroBatcher:
+    """
+        Collects the lookups of one provider endpoint in a Redis list so a single
+        bulk call answers several plugin tasks. The first item of a batch schedules
+        flush_signature after BATCH_WINDOW seconds, a full batch schedules it at
+        once. The flush task takes up to size items, calls the bulk endpoint and
+        stores the results of every item with PluginManager.set_plugin_results.
+    """
+
+    def __init__(self, name, flush_signature, size, window=BATCH_WINDOW):
+        self.key = f"batch:{name}"
+        self.flush_signature = flush_signature
+        self.size = size
+        self.window = window
+
+    def add(self, item):
+        """
+            Queue an item (a JSON serializable dict). Returns False if it could not
+            be queued, the caller then has to do the lookup by itself.
+        """
+        try:
+            client = RedisRegistry.get_client()
+            pipeline = client.pipeline()
+            pipeline.rpush(self.key, json.dumps(item))
+            pipeline.expire(self.key, BATCH_RETENTION)
+            length, _ = pipeline.execute()
+
+            if length % self.size == 0:
+                self.flush_signature.apply_async()
+            elif length == 1:
+                self.flush_signature.apply_async(countdown=self.window)
+
+            return True
+
+        except Exception as e:
+            print(f"[MicroBatcher.add] {self.key}: {e}")
+            tb1 = traceback.TracebackException.from_exception(e)
+            print("".join(tb1.format()))
+            return False
+
+    def take(self):
+        """
+            Pop the next batch, up to size items in arrival order.
+            Items left behind get their own flush.
+        """
+        try:
+            client = RedisRegistry.get_client()
+            pipeline = client.pipeline()
+            pipeline.lrange(self.key, 0, self.size - 1)
+            pipeline.ltrim(self.key, self.size, -1)
+            pipeline.llen(self.key)
+            items, _, remaining = pipeline.execute()
+
+            if remaining:
+                self.flush_signature.apply_async(countdown=self.window)
+
+            return [json.loads(item) for item in items]
+
+        except Exception as e:
+            print(f"[MicroBatcher.take] {self.key}: {e}")
+            tb1 = traceback.TracebackException.from_exception(e)
+            print("".join(tb1.format()))
+            return []
@@ -0,0 +1,116 @@
+import os
+
+# Queue classes a plugin can declare with PLUGIN_QUEUE
+FAST = "fast"  # Sub-second lookups: DNS, whois, geoip...
+SLOW_IO = "slow_io"  # Third party HTTP APIs
+LONG_POLLING = "long_polling"  # Tasks waiting on a remote job: urlscan, pastebin...
+CPU = "cpu"  # Long scans and local processing: sherlock, metagoofil...
+ASYNC_IO = "async_io"  # Async plugins on an event loop, see tasks/async_engine.py
+
+# Used by plugins not declaring PLUGIN_QUEUE and by any other task
+DEFAULT_QUEUE = SLOW_IO
+
+# Worker settings of every queue class, concurrency can be overridden with
+# THETHE_QUEUE_<QUEUE>_CONCURRENCY (ie. THETHE_QUEUE_FAST_CONCURRENCY=32)
+# "lease" is how long, in seconds, a launched task blocks duplicate launches
+# "pool" is the celery execution pool, a worker can only consume queues of one pool
+# "time_limit" is the soft time limit of the plugin tasks, in seconds, unless they
+# declare PLUGIN_TIME_LIMIT. Not enforced by the threads pool (async_io).
+QUEUES = {
+    FAST: {
+        "concurrency": 16,
+        "prefetch_multiplier": 4,
+        "lease": 60,
+        "time_limit": 30,
+    },
+    SLOW_IO: {
+        "concurrency": 8,
+        "prefetch_multiplier": 1,
+        "lease": 300,
+        "time_limit": 180,
+    },
+    LONG_POLLING: {
+        "concurrency": 8,
+        "prefetch_multiplier": 1,
+        "lease": 1800,
+        "time_limit": 900,
+    },
+    CPU: {
+        "concurrency": os.cpu_count() or 2,
+        "prefetch_multiplier": 1,
+        "lease": 3600,
+        "time_limit": 1800,
+    },
+    # Threads only wait on the event loop, hundreds of them are cheap
+    ASYNC_IO: {
+        "concurrency": 200,
+        "prefetch_multiplier": 1,
+        "lease": 300,
+        "time_limit": 180,
+        "pool": "threads",
+    },
+}
+
+# Seconds between the soft time limit, when a task can still store its partial
+# results, and the hard one, when the worker kills it
+TIME_LIMIT_GRACE = 30
+
+DEFAULT_POOL = "prefork"
+
+# Environment variable with the comma separated queues a worker consumes.
+# Every queue when unset.
+WORKER_QUEUES_ENV = "THETHE_WORKER_QUEUES"
+
+
+def queue_concurrency(queue):
+    return int(
+        os.environ.get(
+            f"THETHE_QUEUE_{queue.upper()}_CONCURRENCY", QUEUES[queue]["concurrency"]
+        )
+    )
+
+
+def queue_pool(queue):
+    return QUEUES[queue].get("pool", DEFAULT_POOL)
+
+
+def plugin_time_limit(manifest):
+    """
+        Soft time limit of a plugin task, in seconds
+    """
+    if manifest["PLUGIN_TIME_LIMIT"]:
+        return manifest["PLUGIN_TIME_LIMIT"]
+    return QUEUES[manifest["PLUGIN_QUEUE"]]["time_limit"]
+
+
+def get_worker_queues():
+    queues = os.environ.get(WORKER_QUEUES_ENV)
+    if not queues:
+        return list(QUEUES)
+    return [queue.strip() for queue in queues.split(",")]
+
+
+def get_task_routes(manifests):
+    """
+        Celery task_routes sending every plugin task to its queue class
+    """
+    return {
+        f"{manifest['MODULE']}.{manifest['PLUGIN_TASK']}": {
+            "queue": manifest["PLUGIN_QUEUE"]
+        }
+        for manifest in manifests
+    }
+
+
+def get_task_time_limits(manifests):
+    """
+        Celery task_annotations with the time limits of every plugin task
+    """
+    annotations = {}
+    for manifest in manifests:
+        soft_time_limit = plugin_time_limit(manifest)
+        annotations[f"{manifest['MODULE']}.{manifest['PLUGIN_TASK']}"] = {
+            "soft_time_limit": soft_time_limit,
+            "time_limit": soft_time_limit + TIME_LIMIT_GRACE,
+        }
+    return annotations
@@ -0,0 +1,131 @@
+import random
+import time
+import traceback
+
+from server.db import DB
+from server.redis_db import RedisRegistry
+
+# Token buckets per provider and API key tier: {tier: (capacity, tokens per second)}
+# The tier of a provider is the "tier" field of its entry in the apikeys collection
+# (set it with /api/upload_apikeys), "default" is used when there is none.
+RATE_LIMITS = {
+    "virustotal": {"default": (4, 4 / 60), "premium": (30, 30 / 60)},
+    "shodan": {"default": (1, 1.0)},
+    "abuseipdb": {"default": (10, 1000 / 86400), "basic": (50, 10000 / 86400)},
+    "haveibeenpwned": {
+        "default": (1, 10 / 60),
+        "pwned2": (2, 50 / 60),
+        "pwned3": (4, 100 / 60),
+    },
+    "emailrep": {"default": (10, 10 / 3600)},
+    # pastebin.com asks for one second between queries, be cautious.
+    # Capacity 2: every paste takes two queries (metadata and raw content)
+    # https://pastebin.com/doc_scraping_api#5
+    "pastebin": {"default": (2, 1 / 1.1)},
+    # Capacity 7: a hash lookup queries seven tabs at once
+    "threatminer": {"default": (7, 10 / 60)},
+}
+
+DEFAULT_TIER = "default"
+
+# How long a process trusts the tier read from the apikeys collection, in seconds
+TIER_CACHE_TIME = 60
+
+# Random seconds added to countdowns so deferred tasks do not come back at once
+RETRY_JITTER = 1.0
+
+# Atomic refill and take, returns the seconds to wait for the requested tokens
+# (0 when they have been taken). As a string: Lua numbers become integers.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local requested = tonumber(ARGV[4])
+
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "timestamp")
+local tokens = tonumber(bucket[1]) or capacity
+local timestamp = tonumber(bucket[2]) or now
+
+tokens = math.min(capacity, tokens + math.max(0, now - timestamp) * rate)
+
+local wait = 0
+if tokens >= requested then
+    tokens = tokens - requested
+else
+    wait = (requested - tokens) / rate
+end
+
+redis.call("HMSET", KEYS[1], "tokens", tokens, "timestamp", now)
+redis.call("EXPIRE", KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RateLimiter:
+    """
+        Token bucket limiter shared by every worker through Redis
+    """
+
+    _script = None
+    _tiers = {}
+
+    @classmethod
+    def _get_script(cls):
+        if cls._script is None:
+            cls._script = RedisRegistry.get_client().register_script(
+                TOKEN_BUCKET_SCRIPT
+            )
+        return cls._script
+
+    @classmethod
+    def get_tier(cls, provider):
+        tier, read_at = cls._tiers.get(provider, (None, 0))
+        if time.time() - read_at < TIER_CACHE_TIME:
+            return tier
+
+        entry = DB("apikeys").collection.find_one({"name": provider}, {"tier": 1})
+        tier = entry.get("tier") if entry else None
+        tier = tier if tier in RATE_LIMITS[provider] else DEFAULT_TIER
+        cls._tiers[provider] = (tier, time.time())
+        return tier
+
+    @classmethod
+    def acquire(cls, provider, tokens=1):
+        """
+            Take tokens from the provider bucket.
+            Returns 0 when taken, the seconds to wait otherwise.
+            If Redis is not reachable the call is allowed rather than blocking plugins.
+        """
+        try:
+            tier = cls.get_tier(provider)
+            capacity, rate = RATE_LIMITS[provider][tier]
+            wait = cls._get_script()(
+                keys=[f"ratelimit:{provider}:{tier}"],
+                args=[capacity, rate, time.time(), tokens],
+            )
+            return float(wait)
+
+        except Exception as e:
+            print(f"[RateLimiter.acquire] {provider}: {e}")
+            tb1 = traceback.TracebackException.from_exception(e)
+            print("".join(tb1.format()))
+            return 0
+
+
+def defer(task, wait, **retry_kwargs):
+    """
+        Reschedule a bound task after wait seconds instead of sleeping.
+        task.retry raises, so call it outside any try/except.
+    """
+    countdown = wait + random.uniform(0, RETRY_JITTER)
+    task.retry(countdown=countdown, max_retries=None, **retry_kwargs)
+
+
+def rate_limit(task, provider, tokens=1):
+    """
+        Acquire before outbound calls from a bound task (@celery_app.task(bind=True)),
+        the task is deferred when the provider budget is exhausted
+    """
+    wait = RateLimiter.acquire(provider, tokens)
+    if wait:
+        defer(task, wait)
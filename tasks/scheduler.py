@@ -0,0 +1,41 @@
+"""
+    Periodic tasks, run by celery beat with the schedule stored in Mongo:
+        celery -A tasks.tasks beat
+"""
+from celerybeatmongo.schedulers import MongoScheduler
+
+from server.entities.refresher import Refresher
+from tasks.tasks import celery_app
+
+# Seconds between refreshes of stale plugin results
+REFRESH_INTERVAL = 300
+
+# Entries created in the "schedules" collection if missing: {name: (task, seconds)}
+# They are never overwritten, intervals can be tuned or entries disabled there.
+PERIODIC_TASKS = {
+    "refresh-stale-results": ("tasks.scheduler.refresh_stale_results", REFRESH_INTERVAL)
+}
+
+
+class ThetheScheduler(MongoScheduler):
+    """
+        celerybeat-mongo scheduler creating the periodic tasks of thethe
+    """
+
+    def setup_schedule(self):
+        for name, (task, seconds) in PERIODIC_TASKS.items():
+            if self.Model.objects(name=name).first():
+                continue
+
+            self.Model(
+                name=name,
+                task=task,
+                interval=self.Model.Interval(every=seconds, period="seconds"),
+                enabled=True,
+            ).save()
+            print(f"[ThetheScheduler]: Scheduled {name} every {seconds} seconds")
+
+
+@celery_app.task
+def refresh_stale_results():
+    return Refresher.run()
@@ -1,16 +1,128 @@
-import os
+import time
+import traceback
 
 from celery import Celery
+from celery.signals import after_task_publish, task_postrun, task_prerun
 
-# TODO: Integrar en una sola funcion, se repeite en plugins.py
-EXCLUDE_SET = ["__init__.py", "TEMPLATE.py"]
+from server.db import DATABASE_NAME, MONGO_HOST, MONGO_PASS, MONGO_USER
+from server.entities.inflight import InFlight, HANDED_OFF
+from server.entities.plugin_manifest import get_manifests, get_worker_modules
+from server.entities.plugin_runs import PluginRuns, RUN_DEFERRED, RUN_HANDED_OFF
+from tasks.http_client import add_metrics_hook
+from tasks.queues import (
+    DEFAULT_QUEUE,
+    QUEUES,
+    TIME_LIMIT_GRACE,
+    get_task_routes,
+    get_task_time_limits,
+)
+
+manifests = get_manifests()
 
-plugins = []
-for root, dirs, files in os.walk("server/plugins"):
-    for file in files:
-        if ".py" in file[-3:] and not file in EXCLUDE_SET:
-            plugins.append("server.plugins.{}".format(os.path.splitext(file)[0]))
+# Plugin modules are only imported by the worker, and only the selected ones
+plugins = get_worker_modules(manifests)
 
 celery_app = Celery(
-    "tasks", backend="redis://redis", broker="redis://redis:6379/0", include=plugins,
+    "tasks",
+    backend="redis://redis",
+    broker="redis://redis:6379/0",
+    include=plugins + ["tasks.scheduler"],
+)
+
+# Every plugin task goes to the queue class it declares, see tasks/queues.py
+celery_app.conf.task_routes = get_task_routes(manifests)
+celery_app.conf.task_default_queue = DEFAULT_QUEUE
+
+# Time limits of every plugin task, the rest get the ones of the default queue
+celery_app.conf.task_annotations = get_task_time_limits(manifests)
+celery_app.conf.task_soft_time_limit = QUEUES[DEFAULT_QUEUE]["time_limit"]
+celery_app.conf.task_time_limit = QUEUES[DEFAULT_QUEUE]["time_limit"] + TIME_LIMIT_GRACE
+
+# celery beat keeps its schedule in the "schedules" collection, see tasks/scheduler.py
+celery_app.conf.beat_scheduler = "tasks.scheduler:ThetheScheduler"
+celery_app.conf.mongodb_scheduler_url = (
+    f"mongodb://{MONGO_USER}:{MONGO_PASS}@{MONGO_HOST}/"
 )
+celery_app.conf.mongodb_scheduler_db = DATABASE_NAME
+
+# Outbound calls and bytes of every plugin run, see server/entities/plugin_runs.py
+add_metrics_hook(PluginRuns.count_call)
+
+
+def _is_plugin_run(kwargs):
+    return bool(kwargs) and "plugin_name" in kwargs
+
+
+def _run_id(task_id, kwargs):
+    """
+        Follow-up tasks of a handed off run carry the task id of the run
+    """
+    return kwargs.get("run_id") or task_id
+
+
+@after_task_publish.connect
+def enqueue_plugin_run(headers=None, body=None, routing_key=None, **extra):
+    """
+        Runs in the sending process: web launches, beat refreshes, retries...
+    """
+    args, kwargs, embed = body
+    if _is_plugin_run(kwargs):
+        PluginRuns.enqueued(
+            _run_id(headers["id"], kwargs),
+            kwargs["plugin_name"],
+            kwargs["resource_id"],
+            kwargs["project_id"],
+            routing_key,
+            headers.get("retries") or 0,
+        )
+
+
+@task_prerun.connect
+def start_plugin_run(task_id=None, task=None, kwargs=None, **extra):
+    if _is_plugin_run(kwargs):
+        PluginRuns.started(_run_id(task_id, kwargs), task.request.hostname)
+
+
+@task_postrun.connect
+def finish_plugin_run(
+    task_id=None, task=None, kwargs=None, retval=None, state=None, **extra
+):
+    """
+        Plugin tasks ending without storing results (no API key, errors...) must not
+        block later launches until their lease expires. Deferred tasks keep it, and
+        so do tasks handing the run off to another task (see HANDED_OFF).
+        Plugins catch every exception, SoftTimeLimitExceeded included: tasks which
+        outlived their soft time limit, or were revoked, without storing anything
+        get a TIMEOUT result.
+    """
+    if not _is_plugin_run(kwargs):
+        return
+    run_id = _run_id(task_id, kwargs)
+    if state == "RETRY":
+        PluginRuns.finished(run_id, RUN_DEFERRED)
+        return
+    if retval == HANDED_OFF:
+        PluginRuns.finished(run_id, RUN_HANDED_OFF)
+        return
+
+    start = PluginRuns.context.started_at
+    soft_time_limit = task.soft_time_limit or celery_app.conf.task_soft_time_limit
+    if time.time() - start >= soft_time_limit or InFlight.is_revoked(run_id):
+        # Imported here, the plugin manager imports this module
+        from server.entities.plugin_manager import PluginManager
+
+        try:
+            PluginManager.set_timeout_result(
+                kwargs["resource_id"],
+                kwargs["plugin_name"],
+                kwargs["project_id"],
+                start,
+            )
+
+        except Exception as e:
+            print(f"[tasks.finish_plugin_run] {e}")
+            tb1 = traceback.TracebackException.from_exception(e)
+            print("".join(tb1.format()))
+
+    InFlight.release(kwargs["plugin_name"], kwargs["resource_id"], run_id)
+    PluginRuns.finished(run_id, None)
@@ -0,0 +1,61 @@
+"""
+    Start a celery worker consuming some plugin queue classes, sized for them:
+        python -m tasks.worker fast
+        python -m tasks.worker slow_io,long_polling
+        python -m tasks.worker async_io
+    Every prefork queue is consumed when none is given.
+"""
+import os
+import sys
+
+from tasks.queues import (
+    QUEUES,
+    DEFAULT_POOL,
+    WORKER_QUEUES_ENV,
+    get_worker_queues,
+    queue_concurrency,
+    queue_pool,
+)
+
+
+def main(argv):
+    if len(argv) == 1:
+        argv.append(
+            ",".join(queue for queue in QUEUES if queue_pool(queue) == DEFAULT_POOL)
+        )
+
+    # Read by tasks.tasks to import only the plugins of these queues
+    os.environ[WORKER_QUEUES_ENV] = argv[1]
+
+    queues = get_worker_queues()
+    for queue in queues:
+        if not queue in QUEUES:
+            print(f"[tasks.worker]: Unknown queue {queue}, choices are {list(QUEUES)}")
+            return 1
+
+    pools = set(queue_pool(queue) for queue in queues)
+    if len(pools) > 1:
+        print(f"[tasks.worker]: Queues of different pools need their own workers")
+        return 1
+
+    from tasks.tasks import celery_app
+
+    concurrency = sum(queue_concurrency(queue) for queue in queues)
+    prefetch_multiplier = min(QUEUES[queue]["prefetch_multiplier"] for queue in queues)
+
+    celery_app.worker_main(
+        [
+            "worker",
+            "--loglevel=info",
+            f"--queues={','.join(queues)}",
+            f"--concurrency={concurrency}",
+            f"--prefetch-multiplier={prefetch_multiplier}",
+            f"--pool={pools.pop()}",
+            f"--hostname={'+'.join(queues)}@%h",
+        ]
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))